@@ -0,0 +1,48 @@
+"""
+Compare the free functions rescale/deadband_2/constrain_2 with the
+precompiled Rescaler/Deadband/Constrainer Pipeline, on scalars and arrays.
+
+    python benchmarks/bench_transforms.py
+"""
+from timeit import timeit
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from generalUtils import rescale, deadband_2, constrain_2, Rescaler, Deadband, Constrainer
+
+
+def free(v):
+    return constrain_2(deadband_2(rescale(v, 0, 1023, -1, 1, 'constrain'), -.05, .05), -.8, .8)
+
+
+rescaler = Rescaler(0, 1023, -1, 1, 'constrain')
+pipe = rescaler | Deadband(-.05, .05) | Constrainer(-.8, .8)
+
+
+if __name__ == '__main__':
+    n = 200000
+    t_free = timeit(lambda: rescale(600, 0, 1023, -1, 1, 'constrain'), number=n)
+    t_pipe = timeit(lambda: rescaler(600), number=n)
+    print('scalar rescale, {} calls'.format(n))
+    print('  rescale():      {:.3f}s'.format(t_free))
+    print('  Rescaler:       {:.3f}s  ({:.2f}x)'.format(t_pipe, t_free / t_pipe))
+    t_pipe = timeit(lambda: rescaler.scalar(600), number=n)
+    print('  Rescaler.scalar:{:.3f}s  ({:.2f}x)'.format(t_pipe, t_free / t_pipe))
+
+    t_free = timeit(lambda: free(600), number=n)
+    t_pipe = timeit(lambda: pipe(600), number=n)
+    print('scalar rescale -> deadband -> constrain, {} calls'.format(n))
+    print('  free functions: {:.3f}s'.format(t_free))
+    print('  Pipeline:       {:.3f}s  ({:.2f}x)'.format(t_pipe, t_free / t_pipe))
+    t_pipe = timeit(lambda: pipe.scalar(600), number=n)
+    print('  Pipeline.scalar:{:.3f}s  ({:.2f}x)'.format(t_pipe, t_free / t_pipe))
+
+    vals = np.random.uniform(0, 1023, 1000000)
+    out = np.empty_like(vals)
+    n = 20
+    t_free = timeit(lambda: free(vals), number=n)
+    t_pipe = timeit(lambda: pipe(vals, out=out), number=n)
+    print('array rescale -> deadband -> constrain, {} elements, {} calls'.format(vals.size, n))
+    print('  free functions: {:.3f}s'.format(t_free))
+    print('  Pipeline(out=): {:.3f}s  ({:.2f}x)'.format(t_pipe, t_free / t_pipe))
@@ -50,8 +50,31 @@ def apply_default_args(kwargs, defaultargs):
     return a, SimpleNamespace(**a)
 
 
-def constrain_2(val, less_lim, more_lim):
-    '''Constrains a value to between less_lim and more_lim'''
+def _is_array(val):
+    """Check if 'val' is a numpy ndarray, without importing numpy.
+
+    :param val: thing to check
+    :return: bool, whether 'val' is an instance of numpy.ndarray
+    """
+    np = sys.modules.get('numpy')
+    return np is not None and isinstance(val, np.ndarray)
+
+
+def _empty_like_result(val, *others):
+    """Allocate an uninitialized array for the element-wise result of 'val' with 'others'."""
+    import numpy as np
+    return np.empty(np.broadcast(val, *others).shape, dtype=np.result_type(val, *others))
+
+
+def constrain_2(val, less_lim, more_lim, out=None):
+    '''Constrains a value to between less_lim and more_lim
+
+    If 'val' is a numpy array, it is constrained element-wise. 'out' may be
+    an array to write the result into (can be 'val' itself for in-place operation).
+    '''
+    if _is_array(val):
+        import numpy as np
+        return np.clip(val, less_lim, more_lim, out=out)
     if val < less_lim:
         return less_lim
     elif val > more_lim:
@@ -60,13 +83,13 @@ def constrain_2(val, less_lim, more_lim):
         return val
 
 
-def constrain(val, lim):
+def constrain(val, lim, out=None):
     '''Constrains a value to between -1*lim and lim
     '''
-    return constrain_2(val, -lim, lim)
+    return constrain_2(val, -lim, lim, out=out)
 
 
-def constrain_decider(decider, less_lim, more_lim, output):
+def constrain_decider(decider, less_lim, more_lim, output, out=None):
     '''Compares decider to less_lim and more_lim, returns a *_lim or output.
 
     if decider < less_lim:
@@ -75,7 +98,19 @@ def constrain_decider(decider, less_lim, more_lim, output):
         return more_lim
     else:
         return output
+
+    If 'decider' is a numpy array, the comparison is made element-wise. 'out' may be
+    an array to write the result into.
     '''
+    if _is_array(decider):
+        import numpy as np
+        if out is None:
+            out = _empty_like_result(decider, less_lim, more_lim, output)
+        less, more = decider < less_lim, decider > more_lim  # masks before 'out' may overwrite 'decider'
+        np.copyto(out, output)
+        np.copyto(out, less_lim, where=less)
+        np.copyto(out, more_lim, where=more)
+        return out
     if decider < less_lim:
         return less_lim
     elif decider > more_lim:
@@ -84,7 +119,7 @@ def constrain_decider(decider, less_lim, more_lim, output):
         return output
 
 
-def rescale(val, in_low, in_high, out_low, out_high, outside='raise'):
+def rescale(val, in_low, in_high, out_low, out_high, outside='raise', out=None):
     """ Rescales val in the input range in_low:in_high to the output range
     out_low:out_high.
 
@@ -94,7 +129,13 @@ def rescale(val, in_low, in_high, out_low, out_high, outside='raise'):
     outside='constrain' : return the limiting value at respective end of output range
     outside='ignore' : return result regardless of range
     outside= value or None : return whatever outside is set to
+
+    If 'val' is a numpy array, it is rescaled element-wise and 'outside' is applied
+    to each element (outside=None fills with nan). 'out' may be a float array to write
+    the result into (can be 'val' itself for in-place operation).
     """
+    if _is_array(val):
+        return _rescale_array(val, in_low, in_high, out_low, out_high, outside, out)
 
     # calculate new value
     _ret = ((val - in_low) / (in_high - in_low)) * (out_high - out_low) + out_low
@@ -119,16 +160,63 @@ def rescale(val, in_low, in_high, out_low, out_high, outside='raise'):
     return _ret
 
 
-def deadband_2(val, lower_cutoff, higher_cutoff, default=0.0):
+def _rescale_array(val, in_low, in_high, out_low, out_high, outside='raise', out=None):
+    """Element-wise rescale() of numpy array 'val'. Same operation order as rescale(),
+    so results match it exactly. Writes into 'out' if provided."""
+    import numpy as np
+    if out is None:
+        out = np.empty(np.shape(val), dtype=np.result_type(val, 1.0))
+
+    # keep val for the error message, 'out' may be 'val'
+    if outside == 'raise':
+        val = np.array(val, copy=True) if out is val else val
+
+    # calculate new values
+    np.subtract(val, in_low, out=out)
+    np.true_divide(out, in_high - in_low, out=out)
+    np.multiply(out, out_high - out_low, out=out)
+    np.add(out, out_low, out=out)
+
+    # apply setting
+    if outside == 'ignore':
+        return out
+    if outside == 'constrain':
+        return np.clip(out, out_low, out_high, out=out)
+
+    outside_mask = (out < out_low) | (out > out_high)
+    if outside == 'mid':
+        np.copyto(out, (out_high + out_low) / 2, where=outside_mask)  # middle value
+    elif outside == 'raise':
+        if outside_mask.any():
+            raise Exception('Rescaling {} in {}:{} falls outside {}:{}'.format(
+                np.broadcast_to(val, out.shape)[outside_mask], in_low, in_high, out_low, out_high))
+    else:  # value provided
+        np.copyto(out, np.nan if outside is None else outside, where=outside_mask)
+    return out
+
+
+def deadband_2(val, lower_cutoff, higher_cutoff, default=0.0, out=None):
     """Applies a deadband to 'val' between the cutoffs. If 'val' is not
-    between cutoffs, returns 'default'"""
+    between cutoffs, returns 'default'
+
+    If 'val' is a numpy array, the deadband is applied element-wise. 'out' may be
+    an array to write the result into (can be 'val' itself for in-place operation).
+    """
+    if _is_array(val):
+        import numpy as np
+        inside = (val > lower_cutoff) & (val < higher_cutoff)
+        if out is None:
+            out = _empty_like_result(val, default)
+        np.copyto(out, val)
+        np.copyto(out, default, where=inside)
+        return out
     if val > lower_cutoff and val < higher_cutoff:
         return default
     else:
         return val
 
 
-def deadband(val, range_cutoff, default=0.0):
+def deadband(val, range_cutoff, default=0.0, out=None):
     """Applies a deadband to 'val' of 'range_cutoff' around 'default'.
     With 'default'=0.0, functions same as:
         if abs(val) < range_cutoff:
@@ -136,7 +224,170 @@ def deadband(val, range_cutoff, default=0.0):
         else:
             :return val
     """
-    return deadband_2(val, default - range_cutoff, default + range_cutoff)
+    return deadband_2(val, default - range_cutoff, default + range_cutoff, out=out)
+
+
+class _Transform():
+    """Base for precompiled transforms. Transforms are called like functions,
+    on scalars or numpy arrays, and compose into a Pipeline with '|'.
+        e.g. Rescaler(0, 1023, -1, 1, 'constrain') | Deadband(-.05, .05) | Constrainer(-.8, .8)
+
+    obj.scalar(val) is the compiled scalar-only function, skipping the array check,
+        for the tightest loops. Calling obj(val) on a scalar costs about the same as the
+        free function (CPython's call overhead for callable objects), obj.scalar is faster.
+
+    Subclasses set self.scalar = f(val) and self._array = f(val, out)
+    """
+
+    def __call__(self, val, out=None):
+        if val.__class__ is float or val.__class__ is int:
+            return self.scalar(val)
+        if _is_array(val):
+            return self._array(val, out)
+        return self.scalar(val)
+
+    def __or__(self, other):
+        return Pipeline(self, other)
+
+
+class Rescaler(_Transform):
+    """Precompiled rescale(), for calling many times with the same ranges.
+
+    obj = Rescaler(in_low, in_high, out_low, out_high, outside)
+        see rescale() for arguments
+
+    obj(val, out=None) same as rescale(val, in_low, in_high, out_low, out_high, outside, out)
+    """
+
+    def __init__(self, in_low, in_high, out_low, out_high, outside='raise'):
+        self.in_low, self.in_high = in_low, in_high
+        self.out_low, self.out_high = out_low, out_high
+        self.outside = outside
+        self.scalar = self._compile(in_low, in_high, out_low, out_high, outside)
+        self._array = lambda val, out: _rescale_array(val, in_low, in_high, out_low, out_high, outside, out)
+
+    @staticmethod
+    def _compile(in_low, in_high, out_low, out_high, outside):
+        """Make a scalar rescale function specialized to the ranges and 'outside' setting.
+
+        rescale() operation order is kept (rather than slope*val+offset),
+        so results match it exactly, including at the ends of the range.
+        """
+        in_span = in_high - in_low
+        out_span = out_high - out_low
+
+        if outside == 'ignore':
+            def _rescale(val):
+                return ((val - in_low) / in_span) * out_span + out_low
+            return _rescale
+
+        if outside == 'constrain':
+            def _rescale(val):
+                ret = ((val - in_low) / in_span) * out_span + out_low
+                if ret < out_low:
+                    return out_low
+                elif ret > out_high:
+                    return out_high
+                return ret
+            return _rescale
+
+        if outside == 'raise':
+            def _rescale(val):
+                ret = ((val - in_low) / in_span) * out_span + out_low
+                if ret < out_low or ret > out_high:
+                    raise Exception('Rescaling {} in {}:{} falls outside {}:{}'.format(
+                        val, in_low, in_high, out_low, out_high))
+                return ret
+            return _rescale
+
+        # 'mid' or value provided
+        replacement = (out_high + out_low) / 2 if outside == 'mid' else outside
+
+        def _rescale(val):
+            ret = ((val - in_low) / in_span) * out_span + out_low
+            if ret < out_low or ret > out_high:
+                return replacement
+            return ret
+        return _rescale
+
+
+class Deadband(_Transform):
+    """Precompiled deadband_2().
+
+    obj = Deadband(lower_cutoff, higher_cutoff, default=0.0)
+        see deadband_2() for arguments
+
+    obj(val, out=None) same as deadband_2(val, lower_cutoff, higher_cutoff, default, out)
+    """
+
+    def __init__(self, lower_cutoff, higher_cutoff, default=0.0):
+        self.lower_cutoff, self.higher_cutoff = lower_cutoff, higher_cutoff
+        self.default = default
+
+        def _deadband(val):
+            if lower_cutoff < val < higher_cutoff:
+                return default
+            return val
+        self.scalar = _deadband
+        self._array = lambda val, out: deadband_2(val, lower_cutoff, higher_cutoff, default, out=out)
+
+
+class Constrainer(_Transform):
+    """Precompiled constrain_2().
+
+    obj = Constrainer(less_lim, more_lim)
+        see constrain_2() for arguments
+
+    obj(val, out=None) same as constrain_2(val, less_lim, more_lim, out)
+    """
+
+    def __init__(self, less_lim, more_lim):
+        self.less_lim, self.more_lim = less_lim, more_lim
+
+        def _constrain(val):
+            if val < less_lim:
+                return less_lim
+            elif val > more_lim:
+                return more_lim
+            return val
+        self.scalar = _constrain
+        self._array = lambda val, out: constrain_2(val, less_lim, more_lim, out=out)
+
+
+class Pipeline(_Transform):
+    """Chain of transforms, applied in order.
+
+    obj = Pipeline(*transforms)
+        transforms: Rescaler, Deadband, Constrainer, or Pipeline
+
+    obj(val, out=None) applies each transform to the result of the previous one.
+        Numpy arrays are run through a single float result buffer ('out' if provided),
+        every step writes into it.
+    """
+
+    def __init__(self, *transforms):
+        self.transforms = []
+        for t in transforms:
+            self.transforms.extend(t.transforms if isinstance(t, Pipeline) else [t])
+
+        scalars = tuple(t.scalar for t in self.transforms)
+        arrays = tuple(t._array for t in self.transforms)
+
+        def _pipeline_scalar(val):
+            for f in scalars:
+                val = f(val)
+            return val
+
+        def _pipeline_array(val, out):
+            if out is None:
+                import numpy as np
+                out = np.empty(np.shape(val), dtype=np.result_type(val, 1.0))
+            for f in arrays:
+                val = out = f(val, out)
+            return val
+
+        self.scalar = _pipeline_scalar
+        self._array = _pipeline_array
 
 
 def get_timestamp():
@@ -188,4 +439,5 @@ def get_timestamp():
 
 __all__ = ['is_func', 'get_all_funcs', 'get_all_classes', 'apply_default_args',
            'constrain', 'constrain_2', 'constrain_decider', 'rescale', 'deadband', 'deadband_2',
+           'Rescaler', 'Deadband', 'Constrainer', 'Pipeline',
            'get_timestamp']
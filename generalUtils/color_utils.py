@@ -5,9 +5,25 @@ Find a color name, hex, or rgb from any of these.
 
 Functions:
     tuple_distance(x, y) - x: (int, int, int) -- y: (int, int, int)
+    color_distance(x, y, metric) - x: (int, int, int) -- y: (int, int, int) -- metric: string, see METRICS
+    rgb_to_lab(rgb) - rgb: (int, int, int)
     hex_to_rgb(hex) - hex: string, e.g. '#F0F0F0' or '0xf0f0f0'
     rgb_to_hex(rg) - rgb: (int, int, int)
-    findColor(color) - color: hex string, color name string, or rgb (int, int, int)
+    hex_to_rgb_array(hexes) - hexes: list of hex strings
+    rgb_to_hex_array(rgbs) - rgbs: (N, 3) numpy array or list of (int, int, int)
+    findColor(color, metric) - color: hex string, color name string, or rgb (int, int, int)
+    classify_colors(pixels, metric) - pixels: (H, W, 3) or (N, 3) numpy array of rgb values
+    rebuild_color_index() - refresh findColor's lookup tables after editing colorList entries in place
+
+Classes:
+    ColorIndex(palette) - palette: list in colorList format, default colorList
+
+Metrics (for finding the nearest color):
+    'euclidean' - tuple_distance between rgb tuples (default)
+    'sqeuclidean' - squared tuple_distance, same nearest colors as 'euclidean'
+    'redmean' - rgb distance weighted by the mean red value, a cheap perceptual approximation
+    'cie76' - euclidean distance in CIE L*a*b*
+    'ciede2000' - CIEDE2000 color difference in CIE L*a*b*
 
 Lists:
     colorList[
@@ -42,6 +58,111 @@ def tuple_distance(x, y):
     return sum
 
 
+METRICS = ('euclidean', 'sqeuclidean', 'redmean', 'cie76', 'ciede2000')
+
+# sRGB (8 bit) -> linear rgb
+_SRGB_LINEAR = [v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4 for v in (i / 255 for i in range(256))]
+
+
+def _srgb_linear(v):
+    if isinstance(v, int) and 0 <= v <= 255:
+        return _SRGB_LINEAR[v]
+    v = v / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _lab_f(t):
+    return t ** (1 / 3) if t > 216 / 24389 else t * (24389 / 3132) + 4 / 29
+
+
+def rgb_to_lab(rgb):
+    """Convert an sRGB tuple to CIE L*a*b* (D65 white point).
+
+    :param rgb: (int, int, int), rgb tuple
+    :return: (L, a, b) floats
+    """
+    r, g, b = _srgb_linear(rgb[0]), _srgb_linear(rgb[1]), _srgb_linear(rgb[2])
+    fx = _lab_f((0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047)
+    fy = _lab_f(0.2126729 * r + 0.7151522 * g + 0.0721750 * b)
+    fz = _lab_f((0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def _sq_distance(x, y):
+    d0, d1, d2 = x[0] - y[0], x[1] - y[1], x[2] - y[2]
+    return d0 * d0 + d1 * d1 + d2 * d2
+
+
+def _redmean_sq(x, y):
+    rmean = (x[0] + y[0]) / 2
+    d0, d1, d2 = x[0] - y[0], x[1] - y[1], x[2] - y[2]
+    return (2 + rmean / 256) * (d0 * d0) + 4 * (d1 * d1) + (2 + (255 - rmean) / 256) * (d2 * d2)
+
+
+def _ciede2000(lab1, lab2):
+    """CIEDE2000 color difference, per Sharma, Wu, Dalal (2005)"""
+    from math import sqrt, atan2, degrees, radians, sin, cos, exp
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+
+    C7 = ((sqrt(a1 * a1 + b1 * b1) + sqrt(a2 * a2 + b2 * b2)) / 2) ** 7
+    G = 0.5 * (1 - sqrt(C7 / (C7 + 25 ** 7)))
+    a1, a2 = (1 + G) * a1, (1 + G) * a2
+    C1, C2 = sqrt(a1 * a1 + b1 * b1), sqrt(a2 * a2 + b2 * b2)
+    h1 = degrees(atan2(b1, a1)) % 360
+    h2 = degrees(atan2(b2, a2)) % 360
+
+    dh = h2 - h1
+    if C1 * C2 == 0:
+        dh = 0.0
+    elif dh > 180:
+        dh -= 360
+    elif dh < -180:
+        dh += 360
+    dL, dC, dH = L2 - L1, C2 - C1, 2 * sqrt(C1 * C2) * sin(radians(dh / 2))
+
+    L, C, h = (L1 + L2) / 2, (C1 + C2) / 2, h1 + h2
+    if C1 * C2 != 0:
+        if abs(h1 - h2) <= 180:
+            h = h / 2
+        elif h < 360:
+            h = (h + 360) / 2
+        else:
+            h = (h - 360) / 2
+
+    T = (1 - 0.17 * cos(radians(h - 30)) + 0.24 * cos(radians(2 * h))
+         + 0.32 * cos(radians(3 * h + 6)) - 0.20 * cos(radians(4 * h - 63)))
+    C7 = C ** 7
+    RT = -2 * sqrt(C7 / (C7 + 25 ** 7)) * sin(radians(60 * exp(-((h - 275) / 25) ** 2)))
+    SL = 1 + 0.015 * (L - 50) ** 2 / sqrt(20 + (L - 50) ** 2)
+    SC = 1 + 0.045 * C
+    SH = 1 + 0.015 * C * T
+    dL, dC, dH = dL / SL, dC / SC, dH / SH
+    return sqrt(dL * dL + dC * dC + dH * dH + RT * dC * dH)
+
+
+def color_distance(x, y, metric='euclidean'):
+    """Calculate the distance between rgb tuples by one of METRICS.
+
+    :param x: (int, int, int), rgb tuple
+    :param y: (int, int, int), rgb tuple
+    :param metric: string, one of METRICS
+    :return: float, distance (squared distance for 'sqeuclidean')
+    """
+    from math import sqrt
+    if metric == 'euclidean':
+        return sqrt(_sq_distance(x, y))
+    elif metric == 'sqeuclidean':
+        return _sq_distance(x, y)
+    elif metric == 'redmean':
+        return sqrt(_redmean_sq(x, y))
+    elif metric == 'cie76':
+        return sqrt(_sq_distance(rgb_to_lab(x), rgb_to_lab(y)))
+    elif metric == 'ciede2000':
+        return _ciede2000(rgb_to_lab(x), rgb_to_lab(y))
+    raise ValueError("metric must be one of {}, got {}".format(METRICS, metric))
+
+
 colorList = \
 [(['aliceblue'], '#F0F8FF', (240, 248, 255)),
  (['antiquewhite'], '#FAEBD7', (250, 235, 215)),
@@ -216,40 +337,459 @@ def rgb_to_hex(rgb):
     return r+g+b
 
 
-def findColor(color):
+_HEX_DIGITS = b'0123456789abcdefABCDEF'
+
+
+def hex_to_rgb_array(hexes):
+    """Convert many hex strings to an array of rgb values at once.
+
+    :param hexes: list of strings, e.g. ['#F0F0F0', '0xf0f0f0', 'F0F0F0']
+    :return: (N, 3) uint8 numpy array
+    """
+    import numpy as np
+    error = "hex strings must be 6 digits, with optional '#' or '0x' prefix"
+    raw = ''.join(hexes)
+    if not raw.isascii():
+        raise ValueError(error)
+    # each string's length less its prefix, prefixes found from the characters at each string's start
+    lengths = np.fromiter(map(len, hexes), dtype=np.intp, count=len(hexes))
+    # padded so an empty last string has a first and second character
+    chars = np.frombuffer(raw.encode('ascii') + b'\0\0', dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    first, second = chars[starts], chars[starts + 1]
+    prefix = np.where(first == ord('#'), 1, np.where((first == ord('0')) & ((second | 32) == ord('x')), 2, 0))
+    if np.any(lengths - prefix != 6):
+        raise ValueError(error)
+    # neither '#' nor 'x' are hex digits, so the prefixes can be removed from the joined string
+    joined = raw.replace('#', '').replace('0x', '').replace('0X', '')
+    # fromhex would skip whitespace, anything left after removing the digits is not allowed
+    if len(joined) != 6 * len(hexes) or joined.encode('ascii').translate(None, _HEX_DIGITS):
+        raise ValueError(error)
+    # decoded straight into a buffer the array uses, no copy
+    return np.frombuffer(bytearray.fromhex(joined), dtype=np.uint8).reshape(-1, 3)
+
+
+def rgb_to_hex_array(rgbs, prefix=''):
+    """Convert many rgb values to hex strings at once.
+
+    :param rgbs: (N, 3) numpy array or list of (int, int, int), values 0-255
+    :param prefix: string, prepended to each hex string, e.g. '#'
+    :return: [strings], hex color strings, e.g. ['F0F0F0', ...]
+    """
+    import numpy as np
+    rgbs = np.asarray(rgbs)
+    if rgbs.dtype != np.uint8:
+        if rgbs.size and (rgbs.min() < 0 or rgbs.max() > 255):
+            raise ValueError("rgb values must be between 0 and 255")
+        rgbs = rgbs.astype(np.uint8)
+    digits = rgbs.reshape(-1, 3).tobytes().hex().upper()
+    return [prefix + digits[i:i + 6] for i in range(0, len(digits), 6)]
+
+
+class ColorIndex():
+    """Nearest-color index over a palette.
+    'euclidean'/'sqeuclidean' and 'cie76' queries use a KD-tree on the rgb or L*a*b* values,
+    built on first query, O(log n) per query after that. Other metrics compare against
+    every palette color, with the palette's L*a*b* values computed once.
+
+    obj = ColorIndex(palette)
+        palette: list of colors in colorList format, default colorList
+
+    .nearest(rgb, metric) palette entry closest to rgb by metric (see METRICS), first entry wins ties
+    .nearest_index(rgb, metric) index into palette of .nearest(rgb, metric)
+    """
+
+    def __init__(self, palette=None):
+        self.palette = colorList if palette is None else palette
+        self._trees = dict()  # 'rgb' or 'lab': KD-tree
+        self._lab = None  # [(L, a, b), ...] of the palette
+        self._arrays = dict()  # key: cached numpy arrays, for classify_colors
+
+    def nearest(self, rgb, metric='euclidean'):
+        return self.palette[self.nearest_index(rgb, metric)]
+
+    def nearest_index(self, rgb, metric='euclidean'):
+        if len(self.palette) == 0:
+            raise ValueError("Can not search an empty palette")
+        if metric in ('euclidean', 'sqeuclidean'):
+            return self._nearest_in_tree('rgb', rgb)
+        elif metric == 'cie76':
+            return self._nearest_in_tree('lab', rgb_to_lab(rgb))
+        elif metric == 'redmean':
+            distances = [_redmean_sq(rgb, c[2]) for c in self.palette]
+        elif metric == 'ciede2000':
+            lab = rgb_to_lab(rgb)
+            distances = [_ciede2000(lab, c) for c in self.palette_lab]
+        else:
+            raise ValueError("metric must be one of {}, got {}".format(METRICS, metric))
+        return distances.index(min(distances))
+
+    @property
+    def palette_lab(self):
+        """[(L, a, b), ...] of the palette, computed once"""
+        if self._lab is None:
+            self._lab = [rgb_to_lab(c[2]) for c in self.palette]
+        return self._lab
+
+    def _nearest_in_tree(self, space, point):
+        if space not in self._trees:
+            points = self.palette_lab if space == 'lab' else [c[2] for c in self.palette]
+            self._trees[space] = self._build(list(zip(points, range(len(points)))), 0)
+        best = [float('inf'), -1]  # [squared distance, palette index]
+        self._search(self._trees[space], point, best)
+        return best[1]
+
+    def _palette_arrays(self, key):
+        """numpy arrays of the palette for classify_colors, cached.
+        key: dtype for ((P, 3) rgb array, (P,) squared norms), 'lab' for ((P, 3) L*a*b* array, (P,) squared norms)
+            or 'redmean' for (6, P) coefficients of _redmean_features, None if the palette is not 8 bit integers"""
+        if key not in self._arrays:
+            import numpy as np
+            if key == 'lab':
+                lab = np.array(self.palette_lab, dtype=float).reshape(-1, 3)
+                self._arrays[key] = lab, (lab * lab).sum(axis=1)
+            elif key == 'redmean':
+                self._arrays[key] = _redmean_coefficients(np.array([c[2] for c in self.palette]).reshape(-1, 3))
+            else:
+                rgb = np.array([c[2] for c in self.palette], dtype=key).reshape(-1, 3)
+                self._arrays[key] = rgb, (rgb * rgb).sum(axis=1)
+        return self._arrays[key]
+
+    @classmethod
+    def _build(cls, points, depth):
+        """Build KD-tree node (point, index, axis, left, right) from [(point, index), ...]"""
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        m = len(points) // 2
+        return (points[m][0], points[m][1], axis,
+                cls._build(points[:m], depth + 1), cls._build(points[m + 1:], depth + 1))
+
+    @classmethod
+    def _search(cls, node, point, best):
+        node_point, index, axis, left, right = node
+        d = _sq_distance(point, node_point)
+        if d < best[0] or (d == best[0] and index < best[1]):
+            best[0], best[1] = d, index
+
+        diff = point[axis] - node_point[axis]
+        near, far = (left, right) if diff < 0 else (right, left)
+        if near is not None:
+            cls._search(near, point, best)
+        # '<=' so equally distant colors earlier in the palette are found
+        if far is not None and diff * diff <= best[0]:
+            cls._search(far, point, best)
+
+
+# findColor lookup tables for colorList, built on first use by rebuild_color_index
+_color_index = None  # ColorIndex over colorList
+_name_index = dict()  # upper case name: color
+_hex_index = dict()  # upper case hex without prefix: color
+_rgb_index = dict()  # rgb tuple: color
+_indexed = (None, 0)  # (colorList, len(colorList)) the tables were built from
+
+
+def _normalize_hex(hex):
+    return hex.split('#')[-1].split('0x')[-1].upper()
+
+
+def rebuild_color_index():
+    """Rebuild the lookup tables findColor and classify_colors use for colorList.
+    Appending, removing, or replacing colorList is noticed automatically,
+    call this after editing colorList entries in place.
+    """
+    global _color_index, _name_index, _hex_index, _rgb_index, _indexed
+    names, hexes, rgbs = dict(), dict(), dict()
+    for c in colorList:
+        color = (c[0], c[1].upper(), c[2])
+        # first entry wins, same as searching colorList in order
+        for n in c[0]:
+            names.setdefault(n.upper(), color)
+        hexes.setdefault(_normalize_hex(c[1]), color)
+        rgbs.setdefault(tuple(c[2]), color)
+    _name_index, _hex_index, _rgb_index = names, hexes, rgbs
+    _color_index = ColorIndex(colorList)
+    _indexed = (colorList, len(colorList))
+
+
+def _check_color_index():
+    if _indexed[0] is not colorList or _indexed[1] != len(colorList):
+        rebuild_color_index()
+
+
+def findColor(color, metric='euclidean'):
     """Finds a color in colorList by name, rgb, or hex string.
     If a name string is passed, it must match exactly.
     If rgb (int, int, int) tuple is passed, if no exact match, returns closest color
-        by tuple_distance between values.
+        by 'metric' (default tuple_distance between values).
     If hex string passed, if no exact match, converts to rgb and runs with that tuple.
 
     :param color: hex string, color name string, or rgb (int, int, int)
+    :param metric: string, one of METRICS, for finding the closest color
     :return: ( [possible color name strings], hex string, (r,g,b) )
     """
+    _check_color_index()
     if isinstance(color, str) and (color.startswith('#') or color.startswith('0x')):
-        for c in colorList:
-            if c[1] == color:
-                return c
-        return findColor(hex_to_rgb(color))
+        c = _hex_index.get(_normalize_hex(color))
+        if c is not None:
+            return c
+        return findColor(hex_to_rgb(color), metric)
     if isinstance(color, str):
-        for c in colorList:
-            for n in c[0]:
-                if n.upper() == color.upper():
-                    return c[0], c[1].upper(), c[2]
-        return None
+        return _name_index.get(color.upper())
     if isinstance(color, tuple) and len(color) == 3 and all([isinstance(c, int) for c in color]):
-        _min = 1.1e16
-        _min_c = ''
-        for c in colorList:
-            if c[2] == color:
-                return c[0], c[1].upper(), c[2]
-        for c in colorList:
-            d = tuple_distance(color, c[2])
-            if d < _min:
-                _min = d
-                _min_c = c
-        return (_min_c[0], _min_c[1].upper(), _min_c[2]) if _min_c else None
+        c = _rgb_index.get(color)
+        if c is not None:
+            return c
+        if not colorList:
+            return None
+        c = _color_index.nearest(color, metric)
+        return c[0], c[1].upper(), c[2]
     raise TypeError("color: {} is not the correct format for query".format(color))
 
 
-__all__ = ['colorList', 'hex_to_rgb', 'rgb_to_hex', 'findColor', 'tuple_distance']
+def _rgb_to_lab_array(rgb):
+    """rgb_to_lab of a (N, 3) array"""
+    import numpy as np
+    if rgb.dtype == np.uint8:
+        linear = np.array(_SRGB_LINEAR)[rgb]
+    else:
+        v = rgb / 255
+        linear = np.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+    r, g, b = linear[:, 0], linear[:, 1], linear[:, 2]
+
+    def f(t):
+        return np.where(t > 216 / 24389, t ** (1 / 3), t * (24389 / 3132) + 4 / 29)
+
+    fx = f((0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047)
+    fy = f(0.2126729 * r + 0.7151522 * g + 0.0721750 * b)
+    fz = f((0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883)
+    return np.stack([116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)], axis=1)
+
+
+def _redmean_sq_array(x, y):
+    """_redmean_sq between each row of (N, 3) float array x and rgb tuple y"""
+    rmean = (x[:, 0] + y[0]) / 2
+    d0, d1, d2 = x[:, 0] - y[0], x[:, 1] - y[1], x[:, 2] - y[2]
+    return (2 + rmean / 256) * (d0 * d0) + 4 * (d1 * d1) + (2 + (255 - rmean) / 256) * (d2 * d2)
+
+
+def _redmean_features(x):
+    """(N, 6) features of (N, 3) rgb array x, _redmean_sq(x, c) less terms of x alone is
+    _redmean_features(x) @ _redmean_coefficients(c)"""
+    import numpy as np
+    x = x.astype(float)
+    r, g, b = x[:, 0], x[:, 1], x[:, 2]
+    return np.stack([r * r + b * b, r, g, b, r * b, np.ones(len(x))], axis=1)
+
+
+def _redmean_coefficients(colors):
+    """(6, P) coefficients for _redmean_features of (P, 3) palette rgb array, None unless every value is
+    an integer 0-255. Then every product and sum is a multiple of 1/512 well below 2**44, exact in float64,
+    so the scores order palette colors exactly as _redmean_sq does."""
+    import numpy as np
+    if len(colors) and (colors.dtype.kind not in 'iu' and np.any(colors != np.round(colors))
+                        or colors.min() < 0 or colors.max() > 255):
+        return None
+    R, G, B = (colors[:, i].astype(float) for i in range(3))
+    wb = 767 / 256 - R / 512
+    return np.stack([-R / 512, -4 * R - (R * R + B * B) / 512, -8 * G, -2 * B * wb, B / 256,
+                     2 * R * R + R * R * R / 512 + 4 * G * G + B * B * wb])
+
+
+# rows of pixels scored against the palette at once, so a block's (rows, palette) scores stay in cache
+_SCORE_ROWS = 8192
+
+
+def _score_blocks(start, stop):
+    """Slices of start:stop, _SCORE_ROWS long"""
+    return [slice(i, min(i + _SCORE_ROWS, stop)) for i in range(start, stop, _SCORE_ROWS)]
+
+
+def _nearest_lab(block, colors, norms):
+    """Indices of nearest (P, 3) L*a*b* colors to rows of (N, 3) block by squared distance, first wins ties.
+    Scored in float32 with |p|^2 - 2 p.c + |c|^2 like euclidean. Rows whose two best scores are within
+    rounding of each other are decided by the exact distances."""
+    import numpy as np
+    scale, norms32 = (-2 * colors).astype(np.float32), norms.astype(np.float32)
+    nearest = np.empty(len(block), dtype=np.intp)
+    for rows in _score_blocks(0, len(block)):
+        lab = block[rows]
+        scores = lab.astype(np.float32) @ scale.T
+        scores += norms32
+        out = nearest[rows]
+        np.argmin(scores, axis=1, out=out)
+        r = np.arange(len(lab))
+        best = scores[r, out]
+        scores[r, out] = np.inf
+        # float32 rounding of p and the scores is well under 1e-5 of |p|^2 + |c|^2
+        close = np.nonzero(scores.min(axis=1) - best <= 1e-5 * ((lab * lab).sum(axis=1) + norms.max()))[0]
+        if len(close):
+            x = lab[close, None, :] - colors[None]
+            d0, d1, d2 = x[..., 0], x[..., 1], x[..., 2]
+            out[close] = np.argmin(d0 * d0 + d1 * d1 + d2 * d2, axis=1)
+    return nearest
+
+
+# CIEDE2000 >= |L1 - L2| / SL, SL is at most 1.747 (L = 0 or 100) and the other terms' sum is never negative
+_CIEDE2000_SL_MAX = 1.75
+
+
+def _ciede2000_array(lab1, lab2):
+    """_ciede2000 between each row of (N, 3) L*a*b* array lab1 and L*a*b* tuple lab2
+    (or a tuple of (N,) arrays, for pairs)"""
+    import numpy as np
+    L1, a1, b1 = lab1[:, 0], lab1[:, 1], lab1[:, 2]
+    L2, a2, b2 = lab2
+
+    C7 = ((np.sqrt(a1 * a1 + b1 * b1) + np.sqrt(a2 * a2 + b2 * b2)) / 2) ** 7
+    G = 0.5 * (1 - np.sqrt(C7 / (C7 + 25 ** 7)))
+    a1, a2 = (1 + G) * a1, (1 + G) * a2
+    C1, C2 = np.sqrt(a1 * a1 + b1 * b1), np.sqrt(a2 * a2 + b2 * b2)
+    h1 = np.degrees(np.arctan2(b1, a1)) % 360
+    h2 = np.degrees(np.arctan2(b2, a2)) % 360
+
+    zero = C1 * C2 == 0
+    dh = h2 - h1
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh[zero] = 0.0
+    dL, dC, dH = L2 - L1, C2 - C1, 2 * np.sqrt(C1 * C2) * np.sin(np.radians(dh / 2))
+
+    L, C, h = (L1 + L2) / 2, (C1 + C2) / 2, h1 + h2
+    h = np.where(zero, h, np.where(np.abs(h1 - h2) <= 180, h / 2, np.where(h < 360, (h + 360) / 2, (h - 360) / 2)))
+
+    T = (1 - 0.17 * np.cos(np.radians(h - 30)) + 0.24 * np.cos(np.radians(2 * h))
+         + 0.32 * np.cos(np.radians(3 * h + 6)) - 0.20 * np.cos(np.radians(4 * h - 63)))
+    C7 = C ** 7
+    RT = -2 * np.sqrt(C7 / (C7 + 25 ** 7)) * np.sin(np.radians(60 * np.exp(-((h - 275) / 25) ** 2)))
+    SL = 1 + 0.015 * (L - 50) ** 2 / np.sqrt(20 + (L - 50) ** 2)
+    SC = 1 + 0.045 * C
+    SH = 1 + 0.015 * C * T
+    dL, dC, dH = dL / SL, dC / SC, dH / SH
+    return np.sqrt(dL * dL + dC * dC + dH * dH + RT * dC * dH)
+
+
+def classify_colors(pixels, palette=None, chunk_size=65536, workers=None, metric='euclidean'):
+    """Find the nearest palette color of every pixel, same answers as findColor(rgb)/ColorIndex.nearest.
+    Pixels are processed in chunks of 'chunk_size' to bound memory (about chunk_size * len(palette) * 4 bytes).
+    'euclidean', 'sqeuclidean', 'cie76' and 'redmean' (8 bit values) score a chunk against the palette with one
+    matrix product, 'ciede2000' only compares colors whose lightness difference could beat the best so far,
+    each distinct color of a uint8 image once.
+    'ciede2000' is much slower than the others: about 150k distinct colors per second on one core with
+    colorList, so its time depends on the number of distinct colors rather than pixels. Images of random
+    noise (every pixel distinct) take several seconds per megapixel, quantize them or use 'cie76'.
+
+    :param pixels: (H, W, 3) or (N, 3) numpy array of rgb values, e.g. uint8 image
+    :param palette: list in colorList format or ColorIndex, default colorList
+    :param chunk_size: int, number of pixels per chunk
+    :param workers: int or None, number of threads to classify chunks with
+    :param metric: string, one of METRICS
+    :return: (H, W) or (N,) numpy array of palette indices
+    """
+    import numpy as np
+
+    if metric not in METRICS:
+        raise ValueError("metric must be one of {}, got {}".format(METRICS, metric))
+    if palette is None:
+        _check_color_index()
+        palette = _color_index
+    index = palette if isinstance(palette, ColorIndex) else ColorIndex(palette)
+    if len(index.palette) == 0:
+        raise ValueError("Can not search an empty palette")
+
+    pixels = np.asarray(pixels)
+    if pixels.shape[-1] != 3:
+        raise ValueError("pixels must have shape (..., 3), got {}".format(pixels.shape))
+    flat = pixels.reshape(-1, 3)
+    result = np.empty(len(flat), dtype=np.intp)
+    inverse = None  # pixels' indices into a deduplicated flat and result
+
+    if metric in ('euclidean', 'sqeuclidean'):
+        # nearest minimizes |p - c|^2 = |p|^2 - 2 p.c + |c|^2, |p|^2 is the same for all c.
+        # With 8 bit values every term is an integer < 2^24, exact in float32
+        dtype = np.float32 if pixels.dtype == np.uint8 else np.float64
+        colors, norms = index._palette_arrays(dtype)
+        if dtype is np.float32 and (colors.min() < 0 or colors.max() > 255):
+            colors, norms = index._palette_arrays(np.float64)
+
+        def classify(start):
+            for block in _score_blocks(start, min(start + chunk_size, len(flat))):
+                scores = flat[block].astype(colors.dtype) @ colors.T
+                scores *= -2
+                scores += norms
+                np.argmin(scores, axis=1, out=result[block])  # first palette entry wins ties
+    elif metric == 'cie76':
+        colors, norms = index._palette_arrays('lab')
+
+        def classify(start):
+            result[start:start + chunk_size] = _nearest_lab(_rgb_to_lab_array(flat[start:start + chunk_size]),
+                                                            colors, norms)
+    elif metric == 'redmean' and index._palette_arrays('redmean') is not None and \
+            (pixels.dtype == np.uint8 or pixels.dtype.kind in 'iu' and flat.size and
+             0 <= flat.min() and flat.max() <= 255):
+        # exact for 8 bit values, see _redmean_coefficients
+        coefficients = index._palette_arrays('redmean')
+
+        def classify(start):
+            for block in _score_blocks(start, min(start + chunk_size, len(flat))):
+                np.argmin(_redmean_features(flat[block]) @ coefficients, axis=1, out=result[block])
+    elif metric == 'redmean':
+        # one palette color at a time, same arithmetic as ColorIndex.nearest, memory ~ chunk_size
+        colors = [c[2] for c in index.palette]
+
+        def classify(start):
+            block = flat[start:start + chunk_size].astype(float)
+            best = np.full(len(block), np.inf)
+            out = result[start:start + chunk_size]
+            for i, color in enumerate(colors):
+                d = _redmean_sq_array(block, color)
+                np.copyto(out, i, where=d < best)  # first palette entry wins ties
+                np.minimum(best, d, out=best)
+    else:
+        # start from the cie76 nearest color, then only try palette colors whose lightness alone
+        # is not already farther than the best so far
+        colors, norms = index._palette_arrays('lab')
+        # repeated palette colors tie, the first wins. Only the first is scored, numpy's math can differ
+        # in the last bit between arrays, which would break the tie
+        _, first_of, same = np.unique(colors, axis=0, return_index=True, return_inverse=True)
+        first_of = first_of[same.ravel()]
+
+        def classify_unique(block):
+            lab = _rgb_to_lab_array(block)
+            nearest = first_of[_nearest_lab(lab, colors, norms)]
+            best = _ciede2000_array(lab, (colors[nearest, 0], colors[nearest, 1], colors[nearest, 2]))
+            for i, color in enumerate(colors):
+                if first_of[i] != i:
+                    continue
+                candidates = np.nonzero(np.abs(lab[:, 0] - color[0]) <= best * _CIEDE2000_SL_MAX)[0]
+                d = _ciede2000_array(lab[candidates], tuple(color))
+                better = (d < best[candidates]) | ((d == best[candidates]) & (i < nearest[candidates]))
+                candidates = candidates[better]
+                best[candidates], nearest[candidates] = d[better], i  # first palette entry wins ties
+            return nearest
+
+        if flat.dtype == np.uint8:
+            # each distinct color in the whole image once, mapped back to the pixels at the end
+            codes = (flat[:, 0].astype(np.int32) << 16) | (flat[:, 1].astype(np.int32) << 8) | flat[:, 2]
+            _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+            flat, result = flat[first], np.empty(len(first), dtype=np.intp)
+
+        def classify(start):
+            result[start:start + chunk_size] = classify_unique(flat[start:start + chunk_size])
+
+    starts = range(0, len(flat), chunk_size)
+    if workers is None or workers <= 1:
+        for start in starts:
+            classify(start)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(classify, starts))
+
+    if inverse is not None:
+        result = result[inverse.ravel()]
+    return result.reshape(pixels.shape[:-1])
+
+
+__all__ = ['colorList', 'hex_to_rgb', 'rgb_to_hex', 'hex_to_rgb_array', 'rgb_to_hex_array', 'findColor', 'tuple_distance',
+           'ColorIndex', 'classify_colors', 'rebuild_color_index', 'METRICS', 'color_distance', 'rgb_to_lab']
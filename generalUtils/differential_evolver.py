@@ -1,61 +1,529 @@
 from scipy.optimize._differentialevolution import DifferentialEvolutionSolver, np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict, deque
+from multiprocessing import Pipe, Process
+from scipy.optimize import OptimizeResult
+from scipy._lib._util import MapWrapper
 from tqdm import tqdm
+import asyncio
+import logging
+import json
+import os
+import time
+import zipfile
+
+
+def _evaluate_chunk(func, chunk, args):
+    """Evaluate func on each parameter vector in chunk. Module level so process pools can pickle it."""
+    return [func(parameters, *args) for parameters in chunk]
+
+
+class Progress(object):
+    """Progress of a DESolver, reported through refresh().
+
+    Evaluations are only counted in add(), the counts below are brought up to date and refresh() is
+    called at most every `interval` seconds, at generation boundaries if `generation_refresh`,
+    and in close(). Subclass and override refresh() (and close()) to send progress somewhere.
+
+    Counts for refresh():
+    fevals, fevals_total - function evaluations, total 0 if unknown
+    generation, generations_total - generation (fraction done with the current one), total
+    mutations, mutations_total - evaluations done in the current generation, of how many.
+        The first generation includes evaluating the initial population.
+
+    :param interval: float, least seconds between refresh() calls while counting evaluations
+    """
+    interval = 0.1
+    generation_refresh = True
+
+    def __init__(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        self.fevals = self.fevals_total = self.generation = self.generations_total = 0
+        self.mutations, self.mutations_total = 0, 1
+        self.population_size = 1
+        self.pending = 0
+        self._due = 0.0
+
+    def start(self, fevals, fevals_total, generations_total, population_size):
+        self.fevals, self.fevals_total = fevals, fevals_total
+        self.generations_total, self.population_size = generations_total, population_size
+        self.flush(True)
+
+    def add(self, n=1):
+        """Count 'n' function evaluations"""
+        self.pending += n
+        if time.monotonic() >= self._due:
+            self.flush(True)
+
+    def flush(self, force=False):
+        """Apply counted evaluations, and refresh() if 'force' or the interval has passed"""
+        n, self.pending = self.pending, 0
+        self.fevals += n
+        size = self.population_size
+        if self.fevals >= size * 2:  # first gen complete
+            self.mutations_total = size
+            self.generation = (self.fevals - size) / size
+        else:
+            self.mutations_total = size * 2
+            self.generation = self.fevals / self.mutations_total
+        self.mutations = self.fevals % self.mutations_total
+
+        now = time.monotonic()
+        if force or now >= self._due:
+            self._due = now + self.interval
+            self.refresh()
+
+    def end_generation(self):
+        self.flush(self.generation_refresh)
+
+    def refresh(self):
+        pass
+
+    def close(self):
+        self.flush(True)
+
+
+class TqdmProgress(Progress):
+    """Progress as tqdm bars: pbar_feval, pbar_gens and pbar_gen_mutations"""
+    pbar_feval = pbar_gens = pbar_gen_mutations = None
+
+    def refresh(self):
+        if self.pbar_feval is None:
+            self.pbar_feval = tqdm(
+                initial=self.fevals, total=self.fevals_total,
+                leave=True, ncols=80, desc='F-Evals',
+                bar_format='{desc}: {percentage:.2f}%|{bar}| {n}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
+            self.pbar_gens = tqdm(
+                initial=self.generation, total=self.generations_total,
+                leave=True, ncols=80, desc='Generation',
+                bar_format='{desc}: {percentage:.2f}%|{bar}| {n:.2f}/{total_fmt} [{rate_fmt}{postfix}]')
+            self.pbar_gen_mutations = tqdm(
+                initial=self.mutations, total=self.mutations_total,
+                leave=False, ncols=80, desc='Mutation',
+                bar_format='{desc}: {percentage:.2f}%|{bar}| {n}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
+            return
+        if self.pbar_gen_mutations.total != self.mutations_total or self.mutations < self.pbar_gen_mutations.n:
+            self.pbar_gen_mutations.reset(total=self.mutations_total)
+        self.pbar_feval.update(self.fevals - self.pbar_feval.n)
+        self.pbar_gens.update(self.generation - self.pbar_gens.n)
+        self.pbar_gen_mutations.update(self.mutations - self.pbar_gen_mutations.n)
+
+    def close(self):
+        super().close()
+        for bar in (self.pbar_feval, self.pbar_gens, self.pbar_gen_mutations):
+            if bar is not None:
+                bar.close()
+
+
+class LogProgress(Progress):
+    """Progress as log messages, every `interval` seconds and at close().
+
+    :param logger: logging.Logger, default is this module's
+    :param level: logging level of the messages
+    :param interval: float, least seconds between messages
+    """
+    interval = 10.0
+    generation_refresh = False
+
+    def __init__(self, logger=None, level=logging.INFO, interval=None):
+        super().__init__(interval)
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def refresh(self):
+        self.logger.log(self.level, 'F-Evals: %d/%s, Generation: %.2f/%s, Mutation: %d/%d',
+                        self.fevals, self.fevals_total or '?', self.generation, self.generations_total,
+                        self.mutations, self.mutations_total)
+
+
+class Monitor(object):
+    """Checked by a DESolver after every generation, stops the run or restarts its population
+    when check() gives a reason. Subclass and override check() (and reset()) for other criteria.
+
+    :param action: 'stop' or 'restart' (new population, keeping the best member)
+    :param max_restarts: int or None, stop instead once restarted this many times
+    """
+    success = True
+
+    def __init__(self, action='stop', max_restarts=None):
+        if action not in ('stop', 'restart'):
+            raise ValueError("action must be 'stop' or 'restart', got {}".format(action))
+        self.action = action
+        self.max_restarts = max_restarts
+        self.restarts = 0
+
+    def start(self, solver):
+        """Called when 'solver' is made"""
+        pass
+
+    def reset(self):
+        """Forget history, called when the population is restarted"""
+        pass
+
+    def check(self, solver):
+        """:return: reason (str) to act, or None"""
+        return None
+
+
+class StagnationMonitor(Monitor):
+    """Acts when the best energy improved by less than atol + rtol * |best| over the last `window` generations
+
+    :param window: int, generations
+    :param atol: float, absolute improvement
+    :param rtol: float, improvement relative to the best energy
+    """
+    def __init__(self, window=50, atol=0.0, rtol=1e-6, **kwargs):
+        super().__init__(**kwargs)
+        self.window = window
+        self.atol = atol
+        self.rtol = rtol
+        self._best = deque(maxlen=window + 1)
+
+    def reset(self):
+        self._best.clear()
+
+    def check(self, solver):
+        best = solver.population_energies[0]
+        self._best.append(best)
+        if len(self._best) <= self.window:
+            return None
+        improvement = self._best[0] - best
+        if improvement <= self.atol + self.rtol * abs(best):
+            return 'Best energy improved by {:g} in {} generations.'.format(improvement, self.window)
+        return None
+
+
+class DiversityMonitor(Monitor):
+    """Acts when the population has collapsed: the mean over parameters of the population's standard
+    deviation, as a fraction of the bounds, is below `threshold`
+
+    :param threshold: float, fraction of the bounds
+    """
+    def __init__(self, threshold=1e-3, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+
+    def check(self, solver):
+        # population is kept scaled to [0, 1]
+        diversity = np.mean(np.std(solver.population, axis=0))
+        if diversity < self.threshold:
+            return 'Population diversity {:g} below {:g}.'.format(diversity, self.threshold)
+        return None
+
+
+class TimeBudgetMonitor(Monitor):
+    """Acts when `seconds` have passed since the solver was made
+
+    :param seconds: float, wall-clock budget
+    """
+    success = False
+
+    def __init__(self, seconds, **kwargs):
+        super().__init__(**kwargs)
+        self.seconds = seconds
+        self._start = time.monotonic()
+
+    def start(self, solver):
+        self._start = time.monotonic()
+
+    def check(self, solver):
+        if time.monotonic() - self._start >= self.seconds:
+            return 'Wall-clock budget of {:g} seconds used.'.format(self.seconds)
+        return None
+
+
+class EvaluationHistory(object):
+    """Parameters and energy of every function evaluation, in a preallocated structured array
+    (fields 'x' and 'y') that doubles in size when full, with summary statistics for each generation.
+
+    :param dimensions: int, number of parameters
+    :param capacity: int, evaluations to allocate room for at first
+    :param path: str or None, keep the array in this memory-mapped .npy file instead of in memory.
+        The file holds `capacity` rows, use save() for a file with only the recorded ones.
+    """
+    stats_dtype = np.dtype([('nfev', np.int64), ('min', float), ('mean', float), ('std', float),
+                            ('max', float), ('best', float)])
+
+    def __init__(self, dimensions, capacity=1024, path=None):
+        self.dtype = np.dtype([('x', float, (dimensions,)), ('y', float)])
+        self.path = path
+        self._n = 0
+        self._generation_start = 0
+        self._stats = []
+        self._buffer = self._allocate(max(int(capacity), 1), path)
+
+    def __len__(self):
+        return self._n
+
+    def _allocate(self, capacity, path=None):
+        if path is None:
+            buffer = np.empty(capacity, self.dtype)
+        else:
+            buffer = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=(capacity,))
+        # field views are slow to make, make them once per buffer
+        self._x, self._y = buffer['x'], buffer['y']
+        return buffer
+
+    def _grow(self, needed):
+        old = self._buffer
+        capacity = max(needed, 2 * len(old))
+        if self.path is None:
+            self._buffer = self._allocate(capacity)
+            self._buffer[:self._n] = old[:self._n]
+            return
+        # copy to a bigger file, then swap it in
+        new = self._allocate(capacity, self.path + '.tmp')
+        new[:self._n] = old[:self._n]
+        new.flush()
+        self._buffer = old = None
+        os.replace(self.path + '.tmp', self.path)
+        self._buffer = new
+
+    def append(self, x, y):
+        """Record one evaluation"""
+        if self._n == len(self._buffer):
+            self._grow(self._n + 1)
+        self._x[self._n] = x
+        self._y[self._n] = y
+        self._n += 1
+
+    def extend(self, x, y):
+        """Record evaluations of (S, N) parameters 'x' with (S,) energies 'y'"""
+        count = len(y)
+        if self._n + count > len(self._buffer):
+            self._grow(self._n + count)
+        self._x[self._n:self._n + count] = x
+        self._y[self._n:self._n + count] = y
+        self._n += count
+
+    def end_generation(self, best):
+        """Summarize energies recorded since the last generation, 'best' is the solver's best energy"""
+        y = self._y[self._generation_start:self._n]
+        if len(y):
+            self._stats.append((self._n, y.min(), y.mean(), y.std(), y.max(), best))
+        else:
+            self._stats.append((self._n, np.nan, np.nan, np.nan, np.nan, best))
+        self._generation_start = self._n
+
+    @property
+    def x(self):
+        """(n, N) parameters evaluated, a view"""
+        return self._x[:self._n]
+
+    @property
+    def y(self):
+        """(n,) energies, a view"""
+        return self._y[:self._n]
+
+    @property
+    def records(self):
+        """structured array of evaluations, fields 'x' and 'y', a view"""
+        return self._buffer[:self._n]
+
+    @property
+    def generation_stats(self):
+        """structured array, a row per generation: nfev (recorded so far), min, mean, std and max of
+        the generation's energies, best energy of the population"""
+        return np.array(self._stats, dtype=self.stats_dtype)
+
+    def save(self, path):
+        """Save the recorded evaluations to an .npy file, load with np.load(path)"""
+        np.save(path, self.records)
+
+    def flush(self):
+        """Write a memory-mapped array to disk"""
+        if self.path is not None:
+            self._buffer.flush()
+
+
+class EvaluationCache(object):
+    """LRU cache of objective values, keyed on parameter vectors.
+
+    :param maxsize: int, most entries kept (least recently used are dropped), None for no limit
+    :param tol: float or None, parameters are rounded to multiples of tol for keys, None for exact keys
+    """
+    def __init__(self, maxsize=None, tol=None):
+        self.maxsize = maxsize
+        self.tol = tol
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, parameters):
+        parameters = np.asarray(parameters, dtype=float)
+        if self.tol:
+            return np.round(parameters / self.tol).astype(np.int64).tobytes()
+        return parameters.tobytes()
+
+    def get(self, parameters):
+        """:return: (found, value)"""
+        key = self._key(parameters)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return True, entry[1]
+
+    def put(self, parameters, value):
+        key = self._key(parameters)
+        self._entries[key] = (np.array(parameters, dtype=float), value)
+        self._entries.move_to_end(key)
+        if self.maxsize is not None and len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def to_arrays(self):
+        """:return: (parameters (M, N) array, values (M,) array), least recently used first"""
+        if not self._entries:
+            return np.empty((0, 0)), np.empty(0)
+        x, y = zip(*self._entries.values())
+        return np.array(x), np.array(y, dtype=float)
+
+    def update(self, x, y):
+        """Add entries from parameters 'x' and values 'y', e.g. from to_arrays"""
+        for parameters, value in zip(x, y):
+            self.put(parameters, value)
 
 
 class DESolver(DifferentialEvolutionSolver):
     __doc__ = str(DifferentialEvolutionSolver.__doc__) + \
     """
+    Custom Parameters:
+    p_bars - bool, show tqdm progress bars, same as progress=TqdmProgress()
+    progress - Progress or None, reports progress, e.g. LogProgress(). Evaluations are counted cheaply,
+        and reported at a limited rate (see Progress). Not included in `state`.
+        Only observes: nfev and results are the same with or without it (p_bars also counts
+        the initial population in nfev, as it always has).
+    workers - int, evaluate each generation's population in parallel with this many workers (-1 for all cpus)
+    pool - 'process' (default) or 'thread', kind of concurrent.futures pool used when workers != 1.
+        Processes need a picklable func and args.
+    chunksize - int or None, population members sent to a worker at a time,
+        default splits each generation into about 4 chunks per worker.
+        Progress bars and callbacks are updated in this process as chunks complete.
+    vectorized - bool, func takes the whole (N, S) array of S trial vectors and returns (S,) energies,
+        once per generation (see scipy). feval_callback then gets (S, N) parameters and (S,) energies,
+        nfev and progress bars advance by S.
+    autosave - str or None, checkpoint file path to save to periodically, and at the end of solve().
+        Files are written on a background thread and atomically renamed into place,
+        the one before is kept as path + '.prev'. A generation is skipped if the last write is unfinished.
+    autosave_gens - int or None, autosave every this many generations
+    autosave_secs - float or None, autosave when this many seconds have passed since the last one.
+        If neither is given, autosave every generation.
+    cache - False (default), True or int, reuse objective values of parameters evaluated before,
+        keeping up to this many (True for no limit). Hits are not evaluations: they do not count
+        towards nfev or maxfun, do not call feval_callback and do not advance progress bars.
+    cache_tol - float or None, parameters within about cache_tol of each other share a cache entry,
+        None (default) for exact matches only
+    cache_persist - bool, include the cache in `state` and checkpoints
+    history - False (default), True or int, record every evaluation in an EvaluationHistory,
+        allocating room for this many at first (True for 1024)
+    history_path - str or None, keep the history in this memory-mapped .npy file, for long runs
+    monitors - list of Monitor, e.g. StagnationMonitor(), DiversityMonitor(), TimeBudgetMonitor(3600).
+        Checked after every generation, they stop the run or restart the population (keeping the best member).
+        What they did is listed in `monitor_events`, and in solve()'s result. Not included in `state`.
+
+    Custom Methods:
+    save_checkpoint(path) - save to a binary .npz file, including the random number generator
+    DESolver.load_checkpoint(path, func, args, **kwargs) - resume from a checkpoint file,
+        continues exactly as the saved solver would have
+    DESolver.resume(path, func, args, **kwargs) - resume from the latest readable autosave
+
     Custom Properties:
+    cache - EvaluationCache or None, with hits and misses counters
+    history - EvaluationHistory or None, with x, y, generation_stats and save(path). Not included in `state`.
+    monitor_events - list of dicts (monitor, action, reason, nfev, energy) for each time a monitor acted
     state - kwargs dict to resume with DESolver(func, **state)
     X - copy of population
     Y - copy of function results (ordered same as population)
     y - best result (lowest energy)
     """
 
-    def __init__(self, func, bounds, args=(), p_bars=False, **kwargs):
+    def __init__(self, func, bounds, args=(), p_bars=False, progress=None, pool='process', chunksize=None,
+                 autosave=None, autosave_gens=None, autosave_secs=None,
+                 cache=False, cache_tol=None, cache_persist=False, history=False, history_path=None,
+                 monitors=(), **kwargs):
         # store things needed to make `state`
         self.seed = kwargs.get('seed', None)
         self.workers = kwargs.get('workers', 1)
         self.mutation = kwargs.get('mutation', (0.5, 1))
         self.p_bars = p_bars
+        self.progress = progress if progress is not None else (TqdmProgress() if p_bars else None)
+        self.pool = pool
+        self.chunksize = chunksize
+        self.autosave = autosave
+        self.autosave_gens = autosave_gens
+        self.autosave_secs = autosave_secs
+        self.cache_tol = cache_tol
+        self.cache_persist = cache_persist
+        self.cache = None
+        if cache:
+            self.cache = EvaluationCache(None if cache is True else cache, cache_tol)
+            cache_data = kwargs.pop('cache_data', None)
+            if cache_data is not None:
+                self.cache.update(cache_data['x'], cache_data['y'])
+        kwargs.pop('cache_data', None)
         nrg = kwargs.pop('nrg', None)
         nfev = kwargs.pop('nfev', 0)
         kwargs.setdefault('polish', False)
         self.feval_callback = lambda *x: None
         self.gen_callback = lambda *x: None
 
-        if p_bars is False:
-            def _func(parameters, *args):
-                rv = func(parameters, *args)
-                self.feval_callback(self, parameters, rv, *args)
-                return rv
-        else:
-            # wrap func with pbar updates
-            def _func(parameters, *args):
-                rv = func(parameters, *args)
-                self.feval_callback(self, parameters, rv, *args)
-                if self._inited is False:  # nfev does not get updated during initial population eval
-                    self._nfev += 1
-                if self.p_bars is True:
-                    self.pbar_feval.update()
-                    self.pbar_gen_mutations.update()
-                    self.pbar_gens.update(1 / self.pbar_gen_mutations.total)
-                    # if self.pbar_gen_mutations.n == self.pbar_gen_mutations.total:
-                        # self.pbar_gen_mutations.reset(self.num_population_members)
-                        # self.pbar_gens.moveto(int(self.pbar_gens.n))
-                return rv
+        self._objective = func
+        self._executor = None
+        self.monitors = list(monitors)
+        self.monitor_events = []
+        self._monitor_stop = None
+        self._autosave_executor = None
+        self._autosave_future = None
+        self._autosave_gen = 0
+        self._autosave_time = time.monotonic()
+        if isinstance(self.workers, int) and self.workers != 1:
+            if pool not in ('process', 'thread'):
+                raise ValueError("pool must be 'process' or 'thread', got {}".format(pool))
+            # hand scipy a map-like that evaluates in our pool, so func itself is sent to workers
+            kwargs['workers'] = self._parallel_map
+            kwargs.setdefault('updating', 'deferred')
+        if kwargs.get('vectorized', False):
+            kwargs.setdefault('updating', 'deferred')
+
+        def _func(parameters, *args):
+            if self.cache is not None:
+                if self.vectorized:
+                    return self._cached_vectorized(func, parameters, args)
+                found, rv = self._cache_get(parameters)
+                if found:
+                    return rv
+            rv = func(parameters, *args)
+            if self.cache is not None:
+                self.cache.put(parameters, rv)
+            if self.vectorized:
+                self._record_feval(parameters.T, rv, args, np.size(rv))
+            else:
+                self._record_feval(parameters, rv, args)
+            return rv
 
         super().__init__(_func, bounds, args, **kwargs)
 
+        self.history = None
+        if history is not False and history is not None:
+            self.history = EvaluationHistory(self.parameter_count, 1024 if history is True else history, history_path)
+
         if nrg is not None:
             self.population_energies[:] = nrg[:]
         if nfev != 0:
             self._nfev = nfev
 
         self._inited = nfev >= self.num_population_members
+        for monitor in self.monitors:
+            monitor.start(self)
 
-        if p_bars is False:
-            # the rest of __init__ is tqdm setup
+        if self.progress is None:
+            # the rest of __init__ is progress setup
             return
 
         if not np.isfinite(self.maxfun):  # no max fun
@@ -76,50 +544,178 @@ class DESolver(DifferentialEvolutionSolver):
                 else:
                     maxfeval = self.maxfun
 
-        if self._nfev >= self.num_population_members*2:  # first gen complete
-            mut_total = self.num_population_members
-            gen_initial = (self._nfev - self.num_population_members) / mut_total
-            mut_initial = (self._nfev % self.num_population_members)
-        else:
-            mut_total = self.num_population_members * 2
-            gen_initial = self._nfev / mut_total
-            mut_initial = (self._nfev % mut_total)
-
-        self.pbar_feval = tqdm(
-            initial=self._nfev, total=maxfeval if np.isfinite(maxfeval) else 0,
-            leave=True, ncols=80, desc='F-Evals',
-            bar_format='{desc}: {percentage:.2f}%|{bar}| {n}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
-        self.pbar_gens = tqdm(
-            initial=gen_initial, total=self.maxiter,
-            leave=True, ncols=80, desc='Generation',
-            bar_format='{desc}: {percentage:.2f}%|{bar}| {n:.2f}/{total_fmt} [{rate_fmt}{postfix}]')
-        self.pbar_gen_mutations = tqdm(
-            initial=mut_initial, total=mut_total,
-            leave=False, ncols=80, desc='Mutation',
-            bar_format='{desc}: {percentage:.2f}%|{bar}| {n}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
+        self.progress.start(self._nfev, maxfeval if np.isfinite(maxfeval) else 0,
+                            self.maxiter, self.num_population_members)
+
+    def _record_feval(self, parameters, rv, args, n=1):
+        """Callback and progress accounting for 'n' function evaluations"""
+        self.feval_callback(self, parameters, rv, *args)
+        if self.history is not None:
+            if self.vectorized:
+                self.history.extend(parameters, rv)
+            else:
+                self.history.append(parameters, rv)
+        if self._inited is False and self.p_bars:
+            # tqdm bars have always counted the initial population in nfev, nothing else does
+            self._nfev += n
+        if self.progress is not None:
+            self.progress.add(n)
+
+    def _cache_get(self, parameters):
+        """(found, energy) from the cache. scipy counts every call, so hits are taken back out of nfev.
+        The initial population is counted afterwards (see _calculate_population_energies), leave it be."""
+        found, rv = self.cache.get(parameters)
+        if found and self._inited:
+            self._nfev -= 1
+        return found, rv
+
+    def _cached_vectorized(self, func, parameters, args):
+        """Vectorized func on the (N, S) 'parameters' not in the cache"""
+        energies = np.empty(parameters.shape[1])
+        missing = []
+        for i in range(parameters.shape[1]):
+            found, energies[i] = self._cache_get(parameters[:, i])
+            if not found:
+                missing.append(i)
+        if missing:
+            rv = func(parameters[:, missing], *args)
+            energies[missing] = rv
+            for i, r in zip(missing, np.ravel(rv)):
+                self.cache.put(parameters[:, i], r)
+            self._record_feval(parameters[:, missing].T, rv, args, len(missing))
+        return energies
+
+    def _parallel_map(self, func, population):
+        """Map-like for scipy's `workers`. scipy passes `func` wrapped with the accounting in
+        _record_feval, the unwrapped objective is sent to the pool instead, and the accounting
+        is done here as chunks complete."""
+        n_workers = os.cpu_count() if self.workers == -1 else self.workers
+        if self._executor is None:
+            self._executor = (ProcessPoolExecutor if self.pool == 'process' else ThreadPoolExecutor)(n_workers)
+        population, energies, missing = self._cache_lookup(population)
+        chunksize = self.chunksize or max(1, len(missing) // (n_workers * 4))
+
+        chunks = [missing[i:i + chunksize] for i in range(0, len(missing), chunksize)]
+        futures = [self._executor.submit(_evaluate_chunk, self._objective, [population[i] for i in chunk], self.args)
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for i, rv in zip(chunk, future.result()):
+                energies[i] = self._evaluated(population[i], rv)
+        return energies
+
+    def _cache_lookup(self, population):
+        """For map-likes: (population as a list, energies with cache hits filled in, indices to evaluate)"""
+        population = list(population)
+        energies = [None] * len(population)
+        if self.cache is None:
+            return population, energies, list(range(len(population)))
+        missing = []
+        for i, parameters in enumerate(population):
+            found, energies[i] = self._cache_get(parameters)
+            if not found:
+                missing.append(i)
+        return population, energies, missing
+
+    def _evaluated(self, parameters, rv):
+        """For map-likes: cache and account for an evaluation done elsewhere, returns rv"""
+        if self.cache is not None:
+            self.cache.put(parameters, rv)
+        self._record_feval(parameters, rv, self.args)
+        return rv
+
+    def _autosave_due(self):
+        self._autosave_gen += 1
+        if self.autosave_gens is None and self.autosave_secs is None:
+            return True
+        if self.autosave_gens is not None and self._autosave_gen >= self.autosave_gens:
+            return True
+        return self.autosave_secs is not None and time.monotonic() - self._autosave_time >= self.autosave_secs
+
+    def _start_autosave(self):
+        """Snapshot the solver here and write it to self.autosave on a background thread.
+        Does nothing if the last write is unfinished, raises if it failed."""
+        if self._autosave_future is not None:
+            if not self._autosave_future.done():
+                return
+            self._autosave_future.result()
+        if self._autosave_executor is None:
+            self._autosave_executor = ThreadPoolExecutor(1)
+        header, arrays = self._checkpoint_data()
+        self._autosave_future = self._autosave_executor.submit(
+            self._write_checkpoint, self.autosave, header, arrays, True)
+        self._autosave_gen = 0
+        self._autosave_time = time.monotonic()
+
+    def close(self):
+        """Shut down the worker pool, if any, and wait for an unfinished autosave.
+        Both are restarted if needed."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._autosave_executor is not None:
+            self._autosave_executor.shutdown()
+            self._autosave_executor = None
+            future, self._autosave_future = self._autosave_future, None
+            future.result()
+
+    def __exit__(self, *args):
+        self.close()
+        return super().__exit__(*args)
 
     def _calculate_population_energies(self, population):
+        evaluated = int(min(np.size(population, 0), self.maxfun - self._nfev))
         rv = super()._calculate_population_energies(population)
+        if self.vectorized:  # scipy counts a vectorized call as one evaluation
+            self._nfev += evaluated - 1
         if self._inited is False:
             self._nfev -= self.num_population_members
             self._inited = True
         return rv
 
     def __next__(self):
-        self.pbar_gen_mutations.close()
-        self.pbar_gen_mutations = tqdm(
-            total=self.num_population_members,
-            leave=False, ncols=80, desc='Mutation',
-            bar_format='{desc}: {percentage:.2f}%|{bar}| {n}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]')
-        
-        x, nrg = DifferentialEvolutionSolver.__next__(self)
-        
-        self.pbar_gens.moveto(int(self.pbar_gens.n))
-        self.pbar_gen_mutations.close()
+        try:
+            x, nrg = DifferentialEvolutionSolver.__next__(self)
+        finally:
+            if self.progress is not None:
+                self.progress.end_generation()
+        if self.history is not None:
+            self.history.end_generation(self.population_energies[0])
         self.gen_callback(self)
+        if self.autosave is not None and self._autosave_due():
+            self._start_autosave()
+        if self.monitors:
+            self._check_monitors()
         return x, nrg
 
+    def _check_monitors(self):
+        """Act on the first monitor with a reason, raises StopIteration to stop"""
+        for monitor in self.monitors:
+            reason = monitor.check(self)
+            if reason is None:
+                continue
+            action = monitor.action
+            if action == 'restart' and monitor.max_restarts is not None and monitor.restarts >= monitor.max_restarts:
+                action = 'stop'
+            self.monitor_events.append(dict(monitor=type(monitor).__name__, action=action, reason=reason,
+                                            nfev=self._nfev, energy=float(self.population_energies[0])))
+            if action == 'stop':
+                self._monitor_stop = monitor, reason
+                raise StopIteration
+            monitor.restarts += 1
+            self._restart_population()
+            return
+
+    def _restart_population(self):
+        """New latin hypercube population, keeping the best member. Energies are evaluated next generation."""
+        best, nfev = self.population[0].copy(), self._nfev
+        self.init_population_lhs()  # resets nfev and energies
+        self.population[0] = best
+        self._nfev = nfev
+        for monitor in self.monitors:
+            monitor.reset()
+
     def solve(self):
+        self._monitor_stop = None
         # try:
         res = super().solve()
         # except KeyboardStop as e:
@@ -132,14 +728,145 @@ class DESolver(DifferentialEvolutionSolver):
         #         self._nfev -= 1
         #     elif res.message == _status_message['success']:
         #         self._nfev -= 1
-        if self.p_bars:
-            self.pbar_feval.close()
-            self.pbar_gens.close()
-            self.pbar_gen_mutations.close()
+        if self.progress is not None:
+            self.progress.close()
+        if self.autosave is not None:
+            self._start_autosave()
+        self.close()
+        res.monitor_events = self.monitor_events
+        if self._monitor_stop is not None:
+            monitor, res.message = self._monitor_stop
+            res.success = monitor.success
+            self._monitor_stop = None
         return res
 
+    def save_checkpoint(self, path):
+        """Save the solver to 'path' as an .npz file. Arrays are stored in binary, settings
+        in a JSON header. Internal population and random number generator state are included,
+        so DESolver.load_checkpoint continues exactly as this solver would have.
+
+        :param path: file path, saved as-is (no '.npz' added)
+        """
+        self._write_checkpoint(path, *self._checkpoint_data())
+
+    def _checkpoint_data(self):
+        """(header, arrays) for a checkpoint, copied so they can be written while solving continues"""
+        header = self._settings
+        header['seed'] = None  # replaced by the generator's state
+        arrays = dict(population=self.population.copy(), population_energies=self.population_energies.copy(),
+                      feasible=self.feasible.copy(), constraint_violation=self.constraint_violation.copy())
+        if self.cache is not None and self.cache_persist:
+            arrays['cache_x'], arrays['cache_y'] = self.cache.to_arrays()
+
+        rng = self.random_number_generator
+        if isinstance(rng, np.random.RandomState):
+            rng_state = rng.get_state(legacy=False)
+            arrays['rng_key'] = rng_state['state'].pop('key')
+            header['rng'] = dict(kind='RandomState', **rng_state)
+        else:
+            header['rng'] = dict(kind='Generator', state=rng.bit_generator.state)
+        return header, arrays
+
+    @staticmethod
+    def _write_checkpoint(path, header, arrays, keep_previous=False):
+        """Write to a temporary file, then rename it to 'path', so 'path' is never partially written.
+
+        :param keep_previous: move an existing 'path' to path + '.prev' first
+        """
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, header=np.array(json.dumps(header)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        if keep_previous and os.path.exists(path):
+            os.replace(path, path + '.prev')
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_checkpoint(cls, path, func, args=(), **kwargs):
+        """Make a solver from a file written by save_checkpoint.
+
+        :param path: checkpoint file path
+        :param func: objective function
+        :param args: extra arguments for func
+        :param kwargs: override saved settings, e.g. maxiter
+        :return: DESolver
+        """
+        return cls._from_checkpoint(*cls._read_checkpoint(path), func, args, **kwargs)
+
+    @staticmethod
+    def _read_checkpoint(path):
+        """(header, arrays) from a checkpoint file"""
+        with np.load(path) as data:
+            header = json.loads(str(data['header']))
+            arrays = {k: data[k] for k in data.files if k != 'header'}
+        return header, arrays
+
+    @classmethod
+    def _from_checkpoint(cls, header, arrays, func, args=(), **kwargs):
+        """Solver from _read_checkpoint's (header, arrays), see load_checkpoint"""
+        rng = header.pop('rng')
+        if 'cache_x' in arrays:
+            header['cache_data'] = dict(x=arrays['cache_x'], y=arrays['cache_y'])
+        header.update(kwargs)
+
+        # the population is stored scaled to [0, 1]
+        low, high = np.array(header['bounds'], dtype=float).T
+        init = 0.5 * (low + high) + (arrays['population'] - 0.5) * np.fabs(low - high)
+        solver = cls(func, args=args, init=init, nrg=arrays['population_energies'], **header)
+
+        # exact internal arrays, rather than rescaled ones
+        solver.population = arrays['population']
+        solver.feasible = arrays['feasible']
+        solver.constraint_violation = arrays['constraint_violation']
+
+        if rng.pop('kind') == 'RandomState':
+            rng['state']['key'] = arrays['rng_key']
+            solver.random_number_generator = np.random.RandomState()
+            solver.random_number_generator.set_state(rng)
+        else:
+            bit_generator = getattr(np.random, rng['state']['bit_generator'])()
+            bit_generator.state = rng['state']
+            solver.random_number_generator = np.random.Generator(bit_generator)
+        return solver
+
+    @classmethod
+    def resume(cls, path, func, args=(), **kwargs):
+        """Make a solver from the latest readable autosave: 'path', or path + '.prev' if 'path'
+        is missing or unreadable. The solver keeps autosaving to 'path'.
+
+        :param path: autosave file path
+        :param func: objective function
+        :param args: extra arguments for func
+        :param kwargs: override saved settings, see load_checkpoint
+        :return: DESolver
+        """
+        errors = []
+        for candidate in (path, path + '.prev'):
+            try:
+                checkpoint = cls._read_checkpoint(candidate)
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+                errors.append('{}: {!r}'.format(candidate, e))
+                continue
+            # errors making the solver (e.g. bad kwargs) are not about the file, they are raised
+            return cls._from_checkpoint(*checkpoint, func, args, **kwargs)
+        raise FileNotFoundError('No readable autosave, ' + '; '.join(errors))
+
     @property
     def state(self):
+        state = dict(
+            **self._settings,
+            init=self.X.tolist(),
+            nrg=self.population_energies.tolist()
+        )
+        if self.cache is not None and self.cache_persist:
+            x, y = self.cache.to_arrays()
+            state['cache_data'] = dict(x=x.tolist(), y=y.tolist())
+        return state
+
+    @property
+    def _settings(self):
+        """state without the population"""
         return dict(
             nfev=self._nfev,
             popsize=int(self.num_population_members/self.parameter_count),
@@ -155,11 +882,30 @@ class DESolver(DifferentialEvolutionSolver):
             disp=self.disp,
             updating=self._updating,
             workers=self.workers,
+            vectorized=self.vectorized,
+            pool=self.pool,
+            chunksize=self.chunksize,
+            autosave=self.autosave,
+            autosave_gens=self.autosave_gens,
+            autosave_secs=self.autosave_secs,
+            cache=False if self.cache is None else (self.cache.maxsize or True),
+            cache_tol=self.cache_tol,
+            cache_persist=self.cache_persist,
             p_bars=self.p_bars,
-            init=self.X.tolist(),
-            nrg=self.population_energies.tolist()
         )
 
+    @property
+    def pbar_feval(self):
+        return self.progress.pbar_feval
+
+    @property
+    def pbar_gens(self):
+        return self.progress.pbar_gens
+
+    @property
+    def pbar_gen_mutations(self):
+        return self.progress.pbar_gen_mutations
+
     @property
     def X(self):
         """The current population without internal scaling"""
@@ -174,3 +920,303 @@ class DESolver(DifferentialEvolutionSolver):
     def y(self):
         """The current best energy"""
         return self.population_energies[0]
+
+
+
+class AsyncDESolver(DESolver):
+    """DESolver for a coroutine function objective, `async def func(x, *args)`.
+    Each generation's population is evaluated concurrently on an asyncio event loop kept for the life
+    of the solver (closed by close(), solve() and exiting a `with` block), so objectives can hold
+    connections made on it. Updating is always 'deferred'. Callbacks, progress and the cache
+    are updated as evaluations complete, in the order they complete.
+    `state`, checkpoints, autosave and monitors work as for DESolver.
+    Not usable from a thread already running an event loop, and not with vectorized or polish.
+
+    Custom Parameters:
+    concurrency - int, most evaluations awaited at once (default 8), replaces workers
+
+    See DESolver for the rest.
+    """
+
+    def __init__(self, func, bounds, args=(), concurrency=8, **kwargs):
+        if kwargs.get('vectorized', False) or kwargs.get('polish', False):
+            raise ValueError('AsyncDESolver does not support vectorized or polish')
+        kwargs.pop('workers', None)
+        kwargs['updating'] = 'deferred'
+        self.concurrency = concurrency
+        self._loop = None
+        super().__init__(func, bounds, args, **kwargs)
+        self._mapwrapper = MapWrapper(self._async_map)
+
+    def _async_map(self, func, population):
+        """Map-like for scipy, see _parallel_map"""
+        population, energies, missing = self._cache_lookup(population)
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._evaluate_async(population, energies, missing))
+        return energies
+
+    async def _evaluate_async(self, population, energies, missing):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def evaluate(i):
+            async with semaphore:
+                return i, await self._objective(population[i], *self.args)
+
+        tasks = [asyncio.ensure_future(evaluate(i)) for i in missing]
+        try:
+            for task in asyncio.as_completed(tasks):
+                i, rv = await task
+                energies[i] = self._evaluated(population[i], rv)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """Close the event loop, then see DESolver.close"""
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+        super().close()
+
+    @property
+    def _settings(self):
+        settings = super()._settings
+        del settings['workers']
+        settings['concurrency'] = self.concurrency
+        return settings
+
+def _island_command(solver, command):
+    """Carry out a DEArchipelago command on an island's solver"""
+    name = command[0]
+    if name == 'evolve':
+        generations, migrants = command[1:]
+        done = None
+        for _ in range(generations):
+            try:
+                next(solver)
+            except StopIteration:
+                done = 'maxfun'
+                break
+            if solver.converged():
+                done = 'converged'
+                break
+        # migrants stay scaled to [0, 1], islands share bounds
+        best = np.argsort(solver.population_energies)[:migrants]
+        return dict(x=solver.population[best], y=solver.population_energies[best], nfev=solver._nfev, done=done,
+                    best_x=solver.x, best_y=solver.population_energies[0])
+    if name == 'immigrate':
+        x, y = command[1:]
+        # replace the worst members, where the immigrants are better
+        worst = np.argsort(solver.population_energies)[::-1][:len(y)]
+        better = y < solver.population_energies[worst]
+        worst, x, y = worst[better], x[better], y[better]
+        solver.population[worst] = x
+        solver.population_energies[worst] = y
+        solver.feasible[worst] = True
+        solver.constraint_violation[worst] = 0
+        solver._promote_lowest_energy()
+        return None
+    if name == 'state':
+        return solver.state
+    raise ValueError('Unknown island command {}'.format(name))
+
+
+def _island_worker(conn, func, args, state):
+    """Run one island's DESolver in a process, carrying out commands from its pipe until 'close'"""
+    solver = DESolver(func, args=args, **state)
+    try:
+        while True:
+            command = conn.recv()
+            if command[0] == 'close':
+                break
+            try:
+                conn.send(_island_command(solver, command))
+            except Exception as e:
+                conn.send(e)
+    finally:
+        solver.close()
+        conn.close()
+
+
+class _LocalIsland(object):
+    """An island's DESolver in this process, with the same send/recv interface as a pipe"""
+    def __init__(self, func, args, state):
+        self.solver = DESolver(func, args=args, **state)
+        self._result = None
+
+    def send(self, command):
+        if command[0] == 'close':
+            self.solver.close()
+            return
+        try:
+            self._result = _island_command(self.solver, command)
+        except Exception as e:
+            self._result = e
+
+    def recv(self):
+        return self._result
+
+
+class DEArchipelago(object):
+    """Island model differential evolution: several DESolver populations (islands) evolve independently,
+    each in its own process, and every `migration_interval` generations send copies of their best members
+    to the next island (in a ring), replacing its worst members.
+
+    :param func: objective function, picklable if processes is True
+    :param bounds: bounds for every island, see DESolver
+    :param args: extra arguments for func
+    :param islands: int, number of islands, or a list of DESolver states to resume them from
+    :param migration_interval: int, generations between migrations
+    :param migrants: int, members sent from each island per migration
+    :param maxiter: int, most generations for each island
+    :param seed: None, int or np.random.Generator, used to make a seed for each island
+    :param processes: bool, run each island in a process, False to run them one after the other here
+    :param generation: int, generations done so far (from `state`)
+    :param kwargs: DESolver parameters for every island, e.g. popsize, mutation, maxfun (per island)
+
+    Properties:
+    state - kwargs dict to resume with DEArchipelago(func, **state)
+    x, y - best member and its energy over all islands, from the last migration
+    nfev - function evaluations over all islands
+    """
+    def __init__(self, func, bounds=None, args=(), islands=4, migration_interval=10, migrants=1,
+                 maxiter=1000, seed=None, processes=True, generation=0, **kwargs):
+        self.func = func
+        self.args = args
+        self.bounds = bounds
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.maxiter = maxiter
+        self.processes = processes
+        self.generation = generation
+
+        if isinstance(islands, int):
+            seeds = np.random.default_rng(seed).integers(2**31, size=islands)
+            islands = [dict(kwargs, bounds=bounds, maxiter=maxiter, seed=int(s)) for s in seeds]
+        else:
+            islands = [dict(state, **kwargs) for state in islands]
+        self._island_states = islands
+        self._islands = None
+        self._processes = []
+        self._done = [None] * len(islands)
+        self._nfev = [state.get('nfev', 0) for state in islands]
+        self.x, self.y = None, np.inf
+        for state in islands:
+            if 'nrg' in state and min(state['nrg']) < self.y:
+                best = int(np.argmin(state['nrg']))
+                self.x, self.y = np.array(state['init'][best]), min(state['nrg'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _start(self):
+        if self._islands is not None:
+            return
+        if not self.processes:
+            self._islands = [_LocalIsland(self.func, self.args, state) for state in self._island_states]
+            return
+        self._islands = []
+        for state in self._island_states:
+            conn, child_conn = Pipe()
+            process = Process(target=_island_worker, args=(child_conn, self.func, self.args, state), daemon=True)
+            process.start()
+            child_conn.close()
+            self._islands.append(conn)
+            self._processes.append(process)
+
+    def _command(self, commands):
+        """Send commands to islands {index: command} all at once, then wait for their results"""
+        self._start()
+        for i, command in commands.items():
+            self._islands[i].send(command)
+        results = {i: self._islands[i].recv() for i in commands}
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def close(self):
+        """Stop the island processes. `state` is kept, and they are restarted if needed."""
+        if self._islands is None:
+            return
+        self._island_states = self._states()
+        for island in self._islands:
+            island.send(('close',))
+        for process in self._processes:
+            process.join()
+        self._islands, self._processes = None, []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """Evolve every island up to the next migration, then migrate.
+
+        :return: (x, y) best member and energy over all islands
+        """
+        active = [i for i, done in enumerate(self._done) if not done]
+        if not active or self.generation >= self.maxiter:
+            raise StopIteration
+        generations = min(self.migration_interval, self.maxiter - self.generation)
+        results = self._command({i: ('evolve', generations, self.migrants) for i in active})
+        self.generation += generations
+
+        for i, result in results.items():
+            self._done[i] = result['done']
+            self._nfev[i] = result['nfev']
+            if result['best_y'] < self.y:
+                self.x, self.y = result['best_x'], result['best_y']
+
+        if len(self._done) > 1 and self.migrants > 0:
+            n = len(self._done)
+            self._command({(i + 1) % n: ('immigrate', results[i]['x'], results[i]['y']) for i in results})
+        return self.x, self.y
+
+    def solve(self):
+        """Evolve until every island is done (converged or out of function evaluations) or maxiter
+
+        :return: scipy OptimizeResult, with `islands` the best energy of each island
+        """
+        try:
+            for _ in self:
+                pass
+        finally:
+            self.close()
+        if all(done == 'converged' for done in self._done):
+            message = 'Optimization terminated successfully.'
+        elif all(self._done):
+            message = 'Maximum number of function evaluations has been exceeded.'
+        else:
+            message = 'Maximum number of iterations has been exceeded.'
+        return OptimizeResult(
+            x=self.x, fun=self.y, nit=self.generation, nfev=self.nfev,
+            islands=[min(state['nrg']) for state in self._island_states],
+            success=all(done == 'converged' for done in self._done),
+            message=message)
+
+    def _states(self):
+        if self._islands is None:
+            return [dict(state) for state in self._island_states]
+        results = self._command({i: ('state',) for i in range(len(self._islands))})
+        return [results[i] for i in range(len(self._islands))]
+
+    @property
+    def nfev(self):
+        return int(sum(self._nfev))
+
+    @property
+    def state(self):
+        return dict(
+            islands=self._states(),
+            bounds=self.bounds,
+            migration_interval=self.migration_interval,
+            migrants=self.migrants,
+            maxiter=self.maxiter,
+            processes=self.processes,
+            generation=self.generation,
+        )
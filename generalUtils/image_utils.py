@@ -1,104 +1,249 @@
+import numpy as np
+from functools import lru_cache
+
+
+def _midpoint_octant(radius):
+    """(dx, dy) points of the midpoint circle algorithm, first octant"""
+    points = []
+    dx, dy = radius, 0
+    err = 1 - dx
+    while dx >= dy:
+        points.append((dx, dy))
+        dy += 1
+        if err < 0:
+            err += 2 * dy + 1
+        else:
+            dx -= 1
+            err += 2 * (dy - dx + 1)
+    return points
+
+
+def _disc_mask(radius):
+    """(2*radius+1, 2*radius+1) bool mask of a filled circle, centered.
+    Each row spans [-w, w) around the center, w from the midpoint algorithm."""
+    half_width = np.zeros(2 * radius + 1, dtype=int)
+    for dx, dy in _midpoint_octant(radius):
+        for row, w in ((dy, dx), (-dy, dx), (dx, dy), (-dx, dy)):
+            half_width[row + radius] = max(half_width[row + radius], w)
+    x = np.arange(-radius, radius + 1)
+    return (x >= -half_width[:, None]) & (x < half_width[:, None])
+
+
+@lru_cache(maxsize=512)
+def _circle_offsets(radius, thickness):
+    """Read only (dy, dx) pixel offsets from the center of a circle.
+        thickness == 1: outline, > 1: ring 'thickness' wide outside of 'radius', else: filled
+    """
+    if thickness == 1:
+        offsets = np.array([(y * sy, x * sx) for dx, dy in _midpoint_octant(radius)
+                            for y, x in ((dy, dx), (dx, dy)) for sy in (1, -1) for sx in (1, -1)],
+                           dtype=int).reshape(-1, 2)
+        dy, dx = offsets[:, 0], offsets[:, 1]
+    else:
+        outer = radius + thickness if thickness > 1 else radius
+        mask = _disc_mask(outer)
+        if thickness > 1:
+            mask[thickness:-thickness, thickness:-thickness] &= ~_disc_mask(radius)
+        dy, dx = np.nonzero(mask)
+        dy, dx = dy - outer, dx - outer
+    dy.setflags(write=False)
+    dx.setflags(write=False)
+    return dy, dx
+
+
+def _work_dtype(img_dtype, other_dtype):
+    """dtype to combine values with an image in, without overflow or float64 for 8/16 bit images"""
+    img_dtype, other_dtype = np.dtype(img_dtype), np.dtype(other_dtype)
+    if img_dtype.kind == 'f':
+        return img_dtype
+    small = img_dtype.itemsize <= 2
+    if other_dtype.kind == 'f':
+        return np.dtype(np.float32 if small else np.float64)
+    return np.dtype(np.int32 if small and other_dtype.itemsize <= 2 else np.int64)
+
+
+def _saturate(values, dtype):
+    """Round and clip 'values' (in place when possible) to the range of integer 'dtype'.
+    Returns values ready to be written into an array of 'dtype'."""
+    dtype = np.dtype(dtype)
+    if dtype.kind not in 'iu' or values.dtype == dtype:
+        return values
+    if values.dtype.kind == 'f':
+        values = np.rint(values, out=values if values.flags.writeable and values.ndim else None)
+    info = np.iinfo(dtype)
+    return np.clip(values, info.min, info.max, out=values if values.flags.writeable and values.ndim else None)
+
+
+def _thickness(thickness):
+    thickness = int(thickness) if thickness is not None else 0
+    return thickness if thickness != 0 else 1
+
 
 def draw_circle(img, center, radius, color, thickness=None):
-    height, width = img.shape
-    xc, yc = center
+    """Draw a circle on an image, in place.
+
+    :param img: numpy array, (H, W) or (H, W, C) image to draw on
+    :param center: (x, y) of circle center
+    :param radius: radius of circle
+    :param color: value to set circle pixels to, or one value per channel.
+        Rounded and limited to the range of integer images
+    :param thickness: None, 0 or 1 for an outline, > 1 for a ring 'thickness' wide around 'radius',
+        -1 for a filled circle
+    :return: img
+    """
+    return draw_circles(img, [center], [radius], color, thickness)
+
+
+def draw_circles(img, centers, radii, colors, thickness=None):
+    """Draw many circles on an image at once, in place. Later circles are drawn over earlier ones.
+
+    :param img: numpy array, (H, W) or (H, W, C) image to draw on
+    :param centers: [(x, y), ...] or (N, 2) array of circle centers
+    :param radii: radius for all circles, or one per circle
+    :param colors: color for all circles, or one per circle.
+        A color is a value, or for (H, W, C) images a value per channel:
+        (H, W) images take a value or (N,) values, (H, W, C) images a value, (C,) or (N, C) values.
+        Rounded and limited to the range of integer images
+    :param thickness: see draw_circle, for all circles or one per circle
+    :return: img
+    """
+    centers = np.asarray(centers).reshape(-1, 2).astype(int)
+    n = len(centers)
+    radii = np.broadcast_to(np.asarray(radii).astype(int), n)
+    thickness = np.broadcast_to([_thickness(t) for t in np.ravel(thickness if thickness is not None else 0)], n)
+
+    if n == 0:
+        return img
+
+    colors = _saturate(np.array(colors), img.dtype)
+    per_circle = colors.ndim > img.ndim - 2
+    if per_circle:
+        colors = np.broadcast_to(colors, (n,) + img.shape[2:])
+
+    # circles of the same radius and thickness share offsets
+    shapes, circle_shape = np.unique(np.stack([radii, thickness], axis=1), axis=0, return_inverse=True)
+    circle_shape = circle_shape.ravel()
+    offsets = [_circle_offsets(int(r), int(t)) for r, t in shapes]
+    # consecutive circles are drawn in batches of about _DRAW_BATCH pixels, bounding the memory used
+    ends = np.cumsum(np.array([len(dy) for dy, dx in offsets])[circle_shape])
+    first = 0
+    while first < n:
+        last = max(int(np.searchsorted(ends, ends[first] + _DRAW_BATCH - 1, side='right')), first + 1)
+        batch = slice(first, last)
+        _draw_circle_batch(img, centers[batch], circle_shape[batch], offsets,
+                           colors[batch] if per_circle else colors, per_circle)
+        first = last
+    return img
 
-    xc, yc, radius, thickness = int(xc), int(yc), int(radius), int(thickness) if thickness is not None else 0
 
-    def fill_line(x0, x1, y):
-        if y>=0 and y < height:
-            minx, maxx = max(min(x0,width), 0), min(max(x1,0), width)
-            img[y, minx:maxx] = color
+_DRAW_BATCH = 1 << 18
 
-    def color_pixel(x, y):
-        if x >= 0 and y >= 0 and x < width and y < height:
-            img[y][x] = color
 
-    thickness = thickness if (thickness is not None and thickness != 0) else 1
+def _draw_circle_batch(img, centers, circle_shape, offsets, colors, per_circle):
+    """Draw circles with offsets[circle_shape[i]] around centers[i], in order. Offsets are broadcast
+    against all the centers of their shape at once."""
+    height, width = img.shape[:2]
+    ys, xs, ids = [], [], []
+    shapes = np.unique(circle_shape)
+    for s in shapes:
+        circles = np.nonzero(circle_shape == s)[0]
+        dy, dx = offsets[s]
+        ys.append((centers[circles, 1, None] + dy).ravel())
+        xs.append((centers[circles, 0, None] + dx).ravel())
+        ids.append(np.repeat(circles, len(dy)))
+    ys, xs, ids = np.concatenate(ys), np.concatenate(xs), np.concatenate(ids)
 
-    if thickness>1:
-        draw_circle(img, center, radius+thickness, color, -1)
-        draw_circle(img, center, radius, 0, -1)
-    else:
-        dx, dy = radius, 0
-        err = 1 - dx
-
-        if thickness == 1:
-            while dx >= dy:
-                color_pixel(dx + xc, dy + yc)  # 1
-                color_pixel(dy + xc, dx + yc)  # 2
-                color_pixel(-dy + xc, dx + yc)  # 3
-                color_pixel(-dx + xc, dy + yc)  # 4
-                color_pixel(-dx + xc, -dy + yc)  # 5
-                color_pixel(-dy + xc, -dx + yc)  # 6
-                color_pixel(dx + xc, -dy + yc)  # 7
-                color_pixel(dy + xc, -dx + yc)  # 8
-
-                dy += 1
-                if (err < 0):
-                    err += 2 * dy + 1
-                else:
-                    dx -= 1
-                    err += 2 * (dy - dx + 1)
-        else:
-            while (dx >= dy):
-                fill_line(xc - dx, xc + dx, yc + dy)  # bottom big
-                fill_line(xc - dx, xc + dx, yc - dy)  # top big
-                fill_line(xc - dy, xc + dy, yc + dx)  # bottom small
-                fill_line(xc - dy, xc + dy, yc - dx)  # top small
-
-                dy += 1
-                if (err < 0):
-                    err += 2 * dy + 1
-                else:
-                    dx -= 1
-                    err += 2 * (dy - dx + 1)
-    return img
+    if per_circle and len(shapes) > 1:
+        # back to drawing order, so later circles are drawn over earlier ones
+        order = np.argsort(ids, kind='stable')
+        ys, xs, ids = ys[order], xs[order], ids[order]
+
+    inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+    if per_circle:
+        colors = colors[ids[inside]]
+    img[ys[inside], xs[inside]] = colors
 
 
-def flatten(base, *layers):
-    for mask in layers[::-1]:
-        startx, starty = int(mask.x+mask.offset), int(mask.y+mask.offset)
-        endy = min(base.shape[0] - starty, mask.shape[0])
-        endx = min(base.shape[1] - startx, mask.shape[1])
-        # print('{},{}'.format(starty, startx))
-        # print('{},{}'.format(endy, endx))
-
-        # for r, row in enumerate(mask):
-        #     R = r + starty
-        #     # print('r {}'.format(R))
-        #     if R>=0 and R<base.shape[0]:
-        #         # print('row {}'.format(row))
-        #         for c, val in enumerate(row):
-        #             C = c + startx
-        #             # print('c {}'.format(C))
-        #             if C>=0 and C<base.shape[1]:
-        #                 # print('val {}'.format(val))
-        #                 # print('*** {} {} {}'.format(r+starty, c+startx, base[r+starty][c+startx] +val))
-        #                 base[R].__setitem__(C, base[R][C] + val)
-
-        [[base[r+starty].__setitem__(c+startx, base[r+starty][c+startx] + val)
-           for c,val in enumerate(row) if c+startx>=0 and c+startx<base.shape[1]]
-            for r, row in enumerate(mask) if r+starty>=0 and r+starty<base.shape[0]]
-
-        # [print(row) for row in mask]
-        # [[base[r+starty].__setitem__(c+startx, base[r+starty][c+startx]+val) for c, val in enumerate(row)] for r, row in enumerate(mask)]
-        # [[[print(item) for item in row] for row in col] for col in mask]
-
-        # for y in np.arange(0, min(base.shape[0] - starty, mask.shape[0]), 1):
-        #     for x in np.arange(0, min(base.shape[1] - startx, mask.shape[1]), 1):
-        #         if y + starty >= 0 and x + startx >= 0:
-        #             base[y + starty][x + startx] += mask[y][x]
-
-        # for y in np.arange(0, min(base.shape[0] - starty, mask.shape[0]), 1):
-        #     y += starty
-        #     if y >=0 :
-        #         for x in np.arange(0, min(base.shape[1] - startx, mask.shape[1]), 1):
-        #             x += startx
-        #             if x >= 0:
-        #                 base[y][x] += mask[y][x]
+def _blend_max(region, layer, alpha):
+    if layer.dtype == region.dtype or region.dtype.kind == 'f':
+        np.maximum(region, layer, out=region)
+    else:
+        region[...] = _saturate(np.maximum(region, layer, dtype=_work_dtype(region.dtype, layer.dtype)),
+                                region.dtype)
+
+
+def _blend_add(region, layer, alpha):
+    if region.dtype.kind == 'f':
+        np.add(region, layer, out=region, casting='unsafe')
+    elif region.dtype.kind == 'u' and layer.dtype == region.dtype:
+        # add at most the headroom left in each pixel, without widening
+        headroom = np.subtract(np.iinfo(region.dtype).max, region, dtype=region.dtype)
+        np.minimum(headroom, layer, out=headroom)
+        region += headroom
+    else:
+        total = region.astype(_work_dtype(region.dtype, layer.dtype))
+        total += layer
+        region[...] = _saturate(total, region.dtype)
+
+
+def _blend_over(region, layer, alpha):
+    work = _work_dtype(region.dtype, np.float32)
+    layer = layer.astype(work, copy=False)
+    if region.dtype == work:
+        region += (layer - region) * alpha
+        return
+    blended = region.astype(work)
+    blended += (layer - blended) * alpha
+    region[...] = _saturate(blended, region.dtype)
+
+
+_BLEND_MODES = dict(add=_blend_add, max=_blend_max, over=_blend_over)
+
+
+def flatten(base, *layers, mode='add'):
+    """Composite layers onto base, in place. layers[0] ends up on top.
+
+    Each layer is an array with .x, .y and .offset attributes, its [0, 0] goes at
+    base[y + offset, x + offset]. Parts of a layer outside of base are clipped.
+    Layers are combined straight into base, in base's dtype (uint8, uint16, float32, ...),
+    temporaries are at most the size of a layer, and float32 for 8/16 bit images.
+
+    :param base: numpy array, (H, W) or (H, W, C) image to draw layers onto
+    :param layers: (h, w) or (h, w, C) layer arrays, (h, w) layers apply to every channel of (H, W, C) base.
+        Optionally with an .alpha attribute for mode='over'
+        (0.0-1.0, scalar or (h, w) or (h, w, C) array, default 1.0)
+    :param mode: how layer values are combined with base
+        'add': base + layer (default). Integer bases saturate at the limits of their dtype,
+            they do not wrap around
+        'max': maximum of base and layer
+        'over': layer over base, weighted by the layer's alpha, rounded and limited for integer base
+    :return: base
+    """
+    if mode not in _BLEND_MODES:
+        raise ValueError("mode must be one of {}, got {}".format(list(_BLEND_MODES), mode))
+    blend = _BLEND_MODES[mode]
+    height, width = base.shape[:2]
+
+    for layer in layers[::-1]:
+        startx, starty = int(layer.x + layer.offset), int(layer.y + layer.offset)
+        y0, y1 = max(starty, 0), min(starty + layer.shape[0], height)
+        x0, x1 = max(startx, 0), min(startx + layer.shape[1], width)
+        if y0 >= y1 or x0 >= x1:
+            continue
+        clip = slice(y0 - starty, y1 - starty), slice(x0 - startx, x1 - startx)
+
+        region, values = base[y0:y1, x0:x1], np.asarray(layer)[clip]
+        if region.ndim > values.ndim:
+            values = values[..., None]
+
+        alpha = getattr(layer, 'alpha', 1.0)
+        if np.ndim(alpha) > 0:
+            alpha = np.asarray(alpha, dtype=np.float32)[clip]
+            if region.ndim > alpha.ndim:
+                alpha = alpha[..., None]
+        blend(region, values, alpha)
 
     return base
 
 
-__all__ = ['draw_circle', 'flatten']
+__all__ = ['draw_circle', 'draw_circles', 'flatten']
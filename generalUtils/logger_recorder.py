@@ -1,9 +1,213 @@
 from multiprocessing import Lock
+from threading import Thread, Lock as ThreadLock
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import gzip
+import queue
+import atexit
 import logging
+import json
+import locale
+import shutil
+import struct
+import os
+from operator import itemgetter
 from .general_utils import ensure_file
 from time import time
 
 
+class SegmentedFileHandler(logging.FileHandler):
+    """logging file handler that moves its file to a new segment when it gets too big, too old,
+    or a new day starts. The file at 'filename' is always the current segment.
+
+    obj = SegmentedFileHandler(filename, max_bytes, interval, daily, compress)
+        filename (string): current segment's path
+        max_bytes (int or None): start a new segment before the file would grow past this
+        interval (float or None): start a new segment this many seconds after the current one started
+        daily (bool): start a new segment each day, segments go in a 'YYYY-MM-DD' subdirectory
+        compress (bool): gzip segments in a background thread once they are closed
+
+    Segments are named 'name.YYYYmmdd-HHMMSS.ext' from their first record's time, and listed with
+    their time ranges in 'filename.manifest.json'. Only one process should write to a segmented file.
+
+    .segments(t0, t1) Paths of the segments (and current file) with records in [t0, t1]
+    .remove_before(t) Delete segments that ended before time t
+    .clear() Delete all segments and empty the current file
+    .close() Waits for compression, then closes the file
+    """
+
+    def __init__(self, filename, max_bytes=None, interval=None, daily=False, compress=False, encoding=None):
+        super().__init__(filename, 'a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.daily = daily
+        self.compress = compress
+        self._encoding = self.encoding or locale.getpreferredencoding(False)
+        self.manifest_path = self.baseFilename + '.manifest.json'
+        self._manifest_lock = ThreadLock()
+        self._compressor = None
+        self._manifest = dict(segments=[], current=dict(start=None, end=None))
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self._manifest = json.load(f)
+        self._start, self._end = self._manifest['current']['start'], self._manifest['current']['end']
+
+    def emit(self, record):
+        try:
+            self.write_lines([(record.created, self.format(record) + self.terminator)])
+            self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def roll_if_needed(self, created, nbytes):
+        """Start a new segment if writing 'nbytes' at time 'created' should go in one"""
+        if self._start is None:
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        size = self.stream.tell()
+        if (self.max_bytes is not None and size > 0 and size + nbytes > self.max_bytes) or \
+                (self.interval is not None and created - self._start >= self.interval) or \
+                (self.daily and datetime.date.fromtimestamp(created) != datetime.date.fromtimestamp(self._start)):
+            self.do_rollover()
+
+    def mark(self, created):
+        """Note that a record from time 'created' was written to the current segment"""
+        if self._start is None:
+            self._start = created
+            self._end = created
+            self._save_manifest()
+        self._end = created
+
+    def write_lines(self, lines):
+        """Write [(created, text), ...] already formatted, starting new segments between them as needed.
+        Caller holds the handler's lock."""
+        for created, text in lines:
+            # max_bytes is in bytes as written, not characters
+            nbytes = len(text.encode(self._encoding, self.errors or 'strict')) if self.max_bytes is not None else 0
+            self.roll_if_needed(created, nbytes)
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(text)
+            self.mark(created)
+
+    def do_rollover(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        directory, name = os.path.split(self.baseFilename)
+        if self.daily:
+            directory = os.path.join(directory, datetime.date.fromtimestamp(self._start).isoformat())
+            os.makedirs(directory, exist_ok=True)
+        stem, ext = os.path.splitext(name)
+        stamp = datetime.datetime.fromtimestamp(self._start).strftime('%Y%m%d-%H%M%S')
+        segment = os.path.join(directory, '{}.{}{}'.format(stem, stamp, ext))
+        n = 1
+        while os.path.exists(segment) or os.path.exists(segment + '.gz'):
+            segment = os.path.join(directory, '{}.{}.{}{}'.format(stem, stamp, n, ext))
+            n += 1
+        os.replace(self.baseFilename, segment)
+
+        entry = dict(path=os.path.relpath(segment, os.path.dirname(self.baseFilename)), start=self._start,
+                     end=self._end, bytes=os.path.getsize(segment), compressed=False)
+        with self._manifest_lock:
+            self._manifest['segments'].append(entry)
+        self._start, self._end = None, None
+        self._save_manifest()
+        self.stream = self._open()
+
+        if self.compress:
+            if self._compressor is None:
+                self._compressor = ThreadPoolExecutor(1)
+            self._compressor.submit(self._compress, entry)
+
+    def _compress(self, entry):
+        path = os.path.join(os.path.dirname(self.baseFilename), entry['path'])
+        try:
+            with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        except FileNotFoundError:  # removed before it was compressed
+            return
+        with self._manifest_lock:
+            if entry not in self._manifest['segments']:  # removed meanwhile
+                os.remove(path + '.gz.tmp')
+                return
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+            entry['path'] += '.gz'
+            entry['compressed'] = True
+        self._save_manifest()
+
+    def _save_manifest(self):
+        with self._manifest_lock:
+            self._manifest['current'] = dict(start=self._start, end=self._end)
+            tmp = self.manifest_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._manifest, f, indent=1)
+            os.replace(tmp, self.manifest_path)
+
+    def segments(self, t0=None, t1=None):
+        with self._manifest_lock:
+            entries = list(self._manifest['segments'])
+        entries.append(dict(path=os.path.basename(self.baseFilename), start=self._start, end=self._end))
+        return _select_segments(os.path.dirname(self.baseFilename), entries, t0, t1)
+
+    def remove_before(self, t):
+        with self._manifest_lock:
+            keep = []
+            for entry in self._manifest['segments']:
+                if entry['end'] < t:
+                    path = os.path.join(os.path.dirname(self.baseFilename), entry['path'])
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    keep.append(entry)
+            self._manifest['segments'] = keep
+        self._save_manifest()
+
+    def clear(self):
+        """Delete all segments and empty the current file"""
+        self.remove_before(float('inf'))
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            open(self.baseFilename, 'w').close()
+            self._start, self._end = None, None
+            self._save_manifest()
+        finally:
+            self.release()
+
+    def close(self):
+        if self._compressor is not None:
+            self._compressor.shutdown()
+            self._compressor = None
+        super().close()
+
+
+def find_segments(filename, t0=None, t1=None):
+    """Paths of a segmented log or recording's files with records in [t0, t1], oldest first,
+    from its manifest. Compressed segments end in '.gz', open them with gzip.open.
+
+    :param filename: current segment's path, as given to Logger/SegmentedFileHandler
+    :param t0: float or None, earliest time
+    :param t1: float or None, latest time
+    :return: list of paths
+    """
+    with open(filename + '.manifest.json') as f:
+        manifest = json.load(f)
+    # the current segment's end is only saved when it rolls over
+    current = dict(manifest['current'], path=os.path.basename(filename), end=float('inf'))
+    return _select_segments(os.path.dirname(os.path.abspath(filename)), manifest['segments'] + [current], t0, t1)
+
+
+def _select_segments(directory, entries, t0, t1):
+    """Paths of manifest entries overlapping [t0, t1], an empty current segment is always included"""
+    return [os.path.join(directory, e['path']) for e in entries
+            if e['start'] is None or ((t1 is None or e['start'] <= t1) and (t0 is None or e['end'] >= t0))]
+
+
 class Logger():
     """class logs messages to a file, uses locks to prevent garbling.
 
@@ -17,12 +221,27 @@ class Logger():
                 Default of None keeps all data.
         format_string (str): format string passed direct into logging.Formatter.
                 NOTE: the clearing functions only support default format for now.
+        asynchronous (bool): log() only queues messages, a writer thread writes them
+                to the file in batches. Default False writes on the calling thread.
+        queue_size (int): most messages waiting in the queue when asynchronous
+        overflow (str): when the queue is full, 'block' waits for room, 'drop-oldest'
+                drops the oldest queued message, 'drop-new' drops the new message.
+                Dropped messages are counted in .dropped
+                NOTE: when asynchronous, thread and process in format_string are the writer's.
+        segment_bytes (int or None), segment_seconds (float or None), segment_daily (bool):
+                move the log to a new segment file by size, age, and/or each day into
+                dated subdirectories, see SegmentedFileHandler. Default None, None, False
+                keep a single file.
+        compress (bool): gzip closed segments in a background thread
 
     .log(message, level) Saves data to the Logger's file
         message (any): information to save
         level (int): information's log level, default logging.DEBUG
 
-    #TODO: maybe make subdirectory for each day of logs automatically?
+    .flush() Waits until queued messages are written to the file
+    .close() Writes queued messages and stops the writer thread. log() goes back to writing
+        on the calling thread.
+    .segments(t0, t1) Paths of the log's files with messages in [t0, t1], see find_segments
     """
 
     locks = dict()
@@ -30,7 +249,8 @@ class Logger():
     def __init__(self, filename, logger_name='default',
                  print_out=False, level=logging.INFO, clear=None,
                  format_string='%(asctime)s::%(name)s::%(levelname)s:: %(message)s',
-                 _is_recorder=False
+                 _is_recorder=False, asynchronous=False, queue_size=10000, overflow='block',
+                 segment_bytes=None, segment_seconds=None, segment_daily=False, compress=False
                  ):
         
         self.print_out = print_out
@@ -46,16 +266,32 @@ class Logger():
         self.logger.setLevel(level)
         self.level = level
         
-        if self.logger.hasHandlers():
-            if not self.file.filename in [h.baseFilename for h in self.logger.handlers]:
+        self.fh = None
+        for h in self.logger.handlers:
+            if getattr(h, 'baseFilename', None) == os.path.abspath(self.file.fullpath):
+                self.fh = h
+        if self.fh is None:
+            if segment_bytes is not None or segment_seconds is not None or segment_daily:
+                self.fh = SegmentedFileHandler(self.file.fullpath, segment_bytes, segment_seconds,
+                                               segment_daily, compress)
+            else:
                 self.fh = logging.FileHandler(self.file.fullpath)
-                self.fh.setFormatter(logging.Formatter(format_string))
-                self.logger.addHandler(self.fh)
-        else:
-            self.fh = logging.FileHandler(self.file.fullpath)
             self.fh.setFormatter(logging.Formatter(format_string))
             self.logger.addHandler(self.fh)
 
+        if overflow not in ('block', 'drop-oldest', 'drop-new'):
+            raise ValueError("overflow must be 'block', 'drop-oldest' or 'drop-new', got {}".format(overflow))
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue = None
+        self._writer = None
+        if asynchronous:
+            self._queue = queue.Queue(queue_size)
+            self._writer = Thread(target=self._write_queued, daemon=True,
+                                  name='Logger writer {}'.format(logger_name))
+            self._writer.start()
+            atexit.register(self.close)
+
         if clear is not None:
             self.clear_log(clear)
 
@@ -65,71 +301,248 @@ class Logger():
                 logging.INFO)
     
     def log(self, message, level=logging.DEBUG):
+        if self._queue is not None:
+            if self.logger.isEnabledFor(level):
+                self._enqueue((time(), level, message))
+            return
         with Logger.locks[self.file.fullpath]:
             self.logger.log(level, message)
         if self.print_out and level>=self.logger.level:
             with Logger.locks['print']:
                 print('{}::{}'.format(self.logger_name,message))
 
+    def _enqueue(self, item):
+        if self.overflow == 'block':
+            self._queue.put(item)
+            return
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == 'drop-new':
+                    return
+            try:
+                oldest = self._queue.get_nowait()
+                self._queue.task_done()
+            except queue.Empty:
+                continue
+            if oldest is None:
+                # close() is waiting on the writer, keep its stop signal. Messages after it would
+                # not be written anyway
+                self._queue.put(None)
+                return
+
+    def _write_queued(self, batch_size=1000):
+        """Writer thread, writes queued records in batches until it gets None"""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            try:
+                self._write_records([self._make_record(*item) for item in (batch[:-1] if stop else batch)])
+            except Exception:
+                logging.getLogger(__name__).exception('{}::Failed to write log records'.format(self.logger_name))
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _make_record(self, created, level, message):
+        """LogRecord with the time log() was called"""
+        record = self.logger.makeRecord(self.logger_name, level, '(unknown file)', 0, message, None, None)
+        record.created = created
+        record.msecs = int((created - int(created)) * 1000) + 0.0
+        record.relativeCreated = (created - logging._startTime) * 1000
+        return record
+
+    def _write_records(self, records):
+        """Write records like logging.Logger.callHandlers, with one write for the batch to self.fh
+        (one per record for a SegmentedFileHandler)"""
+        if not records:
+            return
+        with Logger.locks[self.file.fullpath]:
+            lines = [(r.created, self.fh.format(r) + self.fh.terminator) for r in records
+                     if r.levelno >= self.fh.level]
+            self.fh.acquire()
+            try:
+                if isinstance(self.fh, SegmentedFileHandler):
+                    self.fh.write_lines(lines)
+                else:
+                    if self.fh.stream is None:
+                        self.fh.stream = self.fh._open()
+                    self.fh.stream.write(''.join(line for created, line in lines))
+                self.fh.flush()
+            finally:
+                self.fh.release()
+
+            logger = self.logger
+            while logger is not None:
+                for h in logger.handlers:
+                    if h is not self.fh:
+                        for r in records:
+                            if r.levelno >= h.level:
+                                h.handle(r)
+                logger = logger.parent if logger.propagate else None
+
+        if self.print_out:
+            with Logger.locks['print']:
+                for r in records:
+                    if r.levelno >= self.logger.level:
+                        print('{}::{}'.format(self.logger_name, r.msg))
+
+    def segments(self, t0=None, t1=None):
+        """Paths of the log's files with messages in [t0, t1], oldest first"""
+        if isinstance(self.fh, SegmentedFileHandler):
+            return self.fh.segments(t0, t1)
+        return [self.file.fullpath]
+
+    def flush(self):
+        """Wait until queued messages are written"""
+        if self._queue is not None:
+            self._queue.join()
+        else:
+            self.fh.flush()
+
+    def close(self):
+        """Write queued messages and stop the writer thread"""
+        if self._queue is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._queue, self._writer = None, None
+            atexit.unregister(self.close)
+        self.fh.flush()
+
     def clear_log(self, time_to_keep=0.0, timestamp_delim='::', timestamp_fmt='default'):
-        import datetime
+        """Remove logs older than 'time_to_keep' seconds, all logs if 0.
+
+        Timestamps must not decrease through the file. The first line to keep is found with a
+        binary search, the rest of the file is copied to a temporary file which replaces the log.
+        Lines without a timestamp (e.g. multiline messages) go with the line before them, a file
+        whose first line has no default format timestamp (e.g. a custom format_string, a Recorder)
+        is left as is.
+        File handlers in this process are reopened, other processes' would still be writing to
+        the replaced file.
+
+        Segmented logs delete whole segments that ended before then instead, the current
+        segment is kept whole (emptied if 'time_to_keep' is 0).
+        """
+        self.flush()
+        if isinstance(self.fh, SegmentedFileHandler):
+            with Logger.locks[self.file.fullpath]:
+                if time_to_keep > 0.0:
+                    self.fh.remove_before(time() - time_to_keep)
+                else:
+                    self.fh.clear()
+            return
         if time_to_keep <= 0.0:
             with Logger.locks[self.file.fullpath]:
                 with open(self.file.fullpath, 'w') as f:
                     f.close()
+            return
+        if timestamp_fmt != 'default':
+            raise Exception('Deconstructing other time formats not yet implemented')
+
+        keep = time() - time_to_keep  # go backwards in time
+        with Logger.locks[self.file.fullpath]:
+            with open(self.file.fullpath, 'rb') as f:
+                t = self._line_timestamp(f.readline(), timestamp_delim)
+                if t is None or t >= keep:
+                    # no timestamps (other formats, Recorder files) so none known to be old, or none old
+                    return
+                lo, hi = 0, os.path.getsize(self.file.fullpath)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    offset, t = self._timestamped_line(f, mid, timestamp_delim)
+                    if offset is None or t >= keep:
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                start, _ = self._timestamped_line(f, lo, timestamp_delim)
+                if start is None:
+                    start = os.path.getsize(self.file.fullpath)
+
+                f.seek(start)
+                tmp = self.file.fullpath + '.tmp'
+                with open(tmp, 'wb') as out:
+                    shutil.copyfileobj(f, out, 1 << 20)
+            os.replace(tmp, self.file.fullpath)
+            self._reopen_handlers()
+
+    @staticmethod
+    def _timestamped_line(f, position, timestamp_delim):
+        """(offset, time) of the first line in binary file 'f' starting at or after 'position'
+        with a default format timestamp, (None, None) if there is none"""
+        if position > 0:
+            f.seek(position - 1)
+            f.readline()
         else:
-            with Logger.locks[self.file.fullpath]:
-                with open(self.file.fullpath, 'r') as f:
-                    lines = f.readlines()
-                with open(self.file.fullpath, 'w') as f:
-                    f.close()
+            f.seek(0)
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                return None, None
+            t = Logger._line_timestamp(line, timestamp_delim)
+            if t is not None:
+                return offset, t
 
-                save = []
-                keep = time() - time_to_keep  # go backwards in time
-                if timestamp_fmt == 'default':
-                    for line in lines:
-                        timestamp = line.split(timestamp_delim)[0]
-                        try:
-                            t = datetime.datetime.strptime(timestamp, logging.Formatter.default_time_format+',%f')
-                        except ValueError:
-                            print('{}::Timestamp format not yet supported. This data will not be removed \'{}\''.\
-                                  format(self.logger_name,line))
-                            save.append(line)
-                        else:
-                            t = t.timestamp()
-                            if t >= keep:
-                                save.append(line)
-                    with open(self.file.fullpath, 'w') as f:
-                        f.writelines(save)
+    @staticmethod
+    def _line_timestamp(line, timestamp_delim):
+        """Time of a default format line (bytes), None if it has no timestamp"""
+        timestamp = line.decode(errors='replace').split(timestamp_delim)[0]
+        try:
+            return datetime.datetime.strptime(timestamp, logging.Formatter.default_time_format+',%f').timestamp()
+        except ValueError:
+            return None
 
-                else:
-                    raise Exception('Deconstructing other time formats not yet implemented')
+    def _reopen_handlers(self):
+        """Point this process's file handlers for the log at the file now at its path"""
+        path = os.path.abspath(self.file.fullpath)
+        loggers = [logging.getLogger()] + [l for l in logging.Logger.manager.loggerDict.values()
+                                           if isinstance(l, logging.Logger)]
+        for logger in loggers:
+            for h in logger.handlers:
+                if getattr(h, 'baseFilename', None) == path:
+                    h.acquire()
+                    try:
+                        if h.stream is not None:
+                            h.stream.close()
+                        h.stream = None  # reopened by the next emit
+                    finally:
+                        h.release()
 
 
 class Recorder(Logger):
     """class logs strictly data to a file, subclass of Logger.
     
-    obj = Recorder(filename)
+    obj = Recorder(filename, **kwargs)
         filename (string): see Logger for more info
+        kwargs: asynchronous, queue_size, overflow, segment_bytes, segment_seconds,
+            segment_daily, compress, see Logger
         
     .log(message) Saves data to the Logger's file if currently recording
         message (any): information to save
 
     .start_recording() record incoming data to the file
     .stop_recording() do not record data until recording is started again
-    
-    #TODO: maybe make subdirectory for each day of logs automatically?
     """
 
     i = 0  # for unique logger names in backend
     
-    def __init__(self, filename):
+    def __init__(self, filename, **kwargs):
         super().__init__(
             filename,
             level=logging.DEBUG,
             format_string='%(message)s',
             logger_name='Recorder {}{}{}'.format(Recorder.i,Recorder.i**2,Recorder.i*-1),
-            _is_recorder=True
+            _is_recorder=True,
+            **kwargs
             )
         Recorder.i += 1
 
@@ -150,6 +563,400 @@ class Recorder(Logger):
         self.save = False
 
 
+class BinaryRecorder():
+    """class records dicts of numbers/strings to a file as fixed-width binary rows, read them back
+    with read_recording(). Much faster than Recorder for many records.
+
+    obj = BinaryRecorder(filename, buffer_rows, str_width)
+        filename (string): see Logger for more info. Recording to an existing file
+            appends to it, records must match its fields.
+        buffer_rows (int): records kept in memory before they are written to the file
+        str_width (int): least characters kept for str values, longer values in the
+            first record set a wider field. Longer values in later records are cut short.
+
+    The fields are set by the first record: its keys, in order, and the types of its values
+    (bool, int, float, str, bytes or numpy arrays/scalars). Later records must have those keys,
+    others are ignored. Values that int or bool fields can not hold exactly (e.g. 2.7 for a field
+    the first record set with 2) raise TypeError. A '_time' field is added with the time of
+    each .log() call.
+
+    .log(message) Saves data to the file (buffered) if currently recording
+        message (dict): information to save
+    .flush() Writes buffered records to the file
+    .close() Writes buffered records and closes the file
+
+    .start_recording() record incoming data to the file
+    .stop_recording() do not record data until recording is started again
+
+    File format: MAGIC, uint32 header length, JSON header (fields, padded to 64 bytes), rows.
+    """
+
+    MAGIC = b'GUREC01\n'
+
+    def __init__(self, filename, buffer_rows=4096, str_width=32):
+        import numpy as np
+        self._np = np
+        self.file = ensure_file(filename)
+        if self.file.fullpath not in Logger.locks.keys():
+            Logger.locks.update({self.file.fullpath: Lock()})
+        self.buffer_rows = buffer_rows
+        self.str_width = str_width
+        self.save = True
+        self.dtype, self.keys = None, None
+        self._buffer, self._n = None, 0
+        self._f = None
+
+        if os.path.getsize(self.file.fullpath) > 0:
+            self.dtype, _ = _read_recording_header(self.file.fullpath)
+            with Logger.locks[self.file.fullpath]:
+                self._start()
+        atexit.register(self.close)
+
+    def _field(self, key, value):
+        np = self._np
+        if isinstance(value, (bool, np.bool_)):
+            return key, '?'
+        if isinstance(value, (int, np.integer)):
+            return key, '<i8'
+        if isinstance(value, (float, np.floating)):
+            return key, '<f8'
+        if isinstance(value, str):
+            return key, '<U{}'.format(max(self.str_width, len(value)))
+        if isinstance(value, bytes):
+            return key, 'S{}'.format(max(self.str_width, len(value)))
+        value = np.asarray(value)
+        if value.dtype.kind not in 'biufcSU':
+            raise TypeError('{} value of type {} can not be recorded'.format(key, type(value)))
+        return key, value.dtype.str, value.shape
+
+    def _start(self, message=None):
+        """Set fields from the file's header or the first message, open the file for appending.
+        Caller holds the file's lock."""
+        np = self._np
+        if self.dtype is None:
+            self.dtype = np.dtype([('_time', '<f8')] + [self._field(k, v) for k, v in message.items()])
+            header = json.dumps(dict(
+                fields=[[name, self.dtype.fields[name][0].base.str, self.dtype.fields[name][0].shape]
+                        for name in self.dtype.names])).encode()
+            header += b' ' * (-(len(self.MAGIC) + 4 + len(header)) % 64)
+            with open(self.file.fullpath, 'wb') as f:
+                f.write(self.MAGIC + struct.pack('<I', len(header)) + header)
+        self.keys = self.dtype.names[1:]
+        self._values = itemgetter(*self.keys) if len(self.keys) != 1 else lambda m, k=self.keys[0]: (m[k],)
+        bools = {bool, np.bool_}
+        ints = bools | {int} | {np.dtype(c).type for c in np.typecodes['AllInteger']}
+        self._exact = [(k, kind, bools if kind == 'b' else ints) for k, kind in
+                       ((k, self.dtype.fields[k][0].base.kind) for k in self.keys) if kind in 'biu']
+        self._buffer = np.zeros(self.buffer_rows, self.dtype)
+        self._f = open(self.file.fullpath, 'ab')
+
+    def _check_exact(self, message):
+        """Raise TypeError for values int or bool fields would change"""
+        np = self._np
+        for key, kind, scalars in self._exact:
+            value = message[key]
+            if type(value) in scalars:
+                continue
+            value = np.asarray(value)
+            if value.dtype.kind == 'b' or (kind != 'b' and (
+                    value.dtype.kind in 'iu' or value.dtype.kind == 'f' and np.all(value == np.round(value)))):
+                continue
+            raise TypeError("{} value {} does not fit the recording's {} field".format(
+                key, message[key], self.dtype.fields[key][0]))
+
+    def log(self, message):
+        if not self.save:
+            return
+        lock = Logger.locks[self.file.fullpath]
+        lock.acquire()
+        try:
+            if self._buffer is None:
+                self._start(message)
+            if self._exact:
+                self._check_exact(message)
+            self._buffer[self._n] = (time(),) + self._values(message)
+            self._n += 1
+            if self._n == self.buffer_rows:
+                self._write()
+        finally:
+            lock.release()
+
+    def _write(self):
+        """Write buffered rows, caller holds the file's lock"""
+        if self._f is None or self._n == 0:
+            return
+        self._f.write(self._buffer[:self._n].tobytes())
+        self._f.flush()
+        self._n = 0
+
+    def flush(self):
+        with Logger.locks[self.file.fullpath]:
+            self._write()
+
+    def close(self):
+        with Logger.locks[self.file.fullpath]:
+            if self._f is None:
+                return
+            self._write()
+            self._f.close()
+            self._f, self._buffer = None, None
+        atexit.unregister(self.close)
+
+    def start_recording(self):
+        self.save = True
+
+    def stop_recording(self):
+        self.save = False
+
+
+def _read_recording_header(filename):
+    """(dtype, offset of the first row) of a BinaryRecorder file"""
+    import numpy as np
+    with open(filename, 'rb') as f:
+        magic = f.read(len(BinaryRecorder.MAGIC))
+        if magic != BinaryRecorder.MAGIC:
+            raise ValueError('{} is not a BinaryRecorder file'.format(filename))
+        length, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length).decode())
+    dtype = np.dtype([(name, base, tuple(shape)) for name, base, shape in header['fields']])
+    return dtype, len(BinaryRecorder.MAGIC) + 4 + length
+
+
+def read_recording(filename, mmap=False):
+    """Read a file written by BinaryRecorder.
+
+    :param filename: file path
+    :param mmap: bool, memory-map the file instead of reading it, for big files
+    :return: numpy structured array, a row per record, a field per key and '_time'.
+        A partly written last row (e.g. from a crash) is left out.
+    """
+    import numpy as np
+    dtype, offset = _read_recording_header(filename)
+    count = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if mmap:
+        return np.memmap(filename, dtype, mode='r', offset=offset, shape=(count,))
+    return np.fromfile(filename, dtype, count=count, offset=offset)
+
+
+def _parse_value(value):
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_record(line, convert=True):
+    """dict from a Recorder line 'key,value;key,value;'"""
+    record = dict()
+    for item in line.rstrip('\n').split(';'):
+        if item:
+            key, _, value = item.partition(',')
+            record[key] = _parse_value(value) if convert else value
+    return record
+
+
+class RecorderReader():
+    """class reads files written by Recorder or BinaryRecorder, streaming, without loading whole files.
+
+    obj = RecorderReader(filename, time_key, index, index_stride, convert)
+        filename (string): recording file path
+        time_key (string): key holding each record's time, for time ranges and find_time.
+            Times must not decrease through the file. BinaryRecorder's '_time' by default,
+            Recorder files need to record it themselves.
+        index (bool): for Recorder files, keep a sidecar index 'filename.idx.npz' with the offset
+            (and time) of every index_stride-th record, for seeking. It is made on first use,
+            extended when the file has grown and remade when the file was truncated or rewritten.
+        index_stride (int): records between index entries
+        convert (bool): for Recorder files, convert values to int or float where possible
+
+    len(obj) Number of complete records
+    obj[n] The n-th record (dict)
+
+    .records(fields, start, stop, t0, t1) Generator of record dicts
+        fields (list or None): keys to include, None for all
+        start, stop (int or None): record numbers, like a slice
+        t0, t1 (float or None): only records with t0 <= time < t1
+    .columns(fields, chunk_size, ...) Generator of dicts of numpy arrays, chunk_size records each.
+        Takes the same filters as records(). fields default to the first record's keys.
+    .find_time(t) Number of the first record with time >= t
+    """
+
+    def __init__(self, filename, time_key='_time', index=True, index_stride=64, convert=True):
+        self.filename = filename
+        self.time_key = time_key
+        self.index_stride = index_stride
+        self.convert = convert
+        self.use_index = index
+        self._offsets, self._times, self._size = None, None, 0
+
+        with open(filename, 'rb') as f:
+            self.binary = f.read(len(BinaryRecorder.MAGIC)) == BinaryRecorder.MAGIC
+        if self.binary:
+            self.dtype, self._data_offset = _read_recording_header(filename)
+
+    # binary files
+    def _rows(self):
+        return read_recording(self.filename, mmap=True)
+
+    # text files
+    def _update_index(self):
+        """Index complete records from where the index left off, saving it if enabled.
+        Starts over when the indexed part of the file has changed (truncated or rewritten)."""
+        import numpy as np
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as f:
+            if self._offsets is None:
+                self._reset_index()
+                if self.use_index and os.path.exists(self.filename + '.idx.npz'):
+                    with np.load(self.filename + '.idx.npz') as saved:
+                        if ('check' in saved.files and int(saved['stride']) == self.index_stride
+                                and int(saved['size']) <= size
+                                and saved['check'].tobytes() == self._index_check(f, int(saved['size']))):
+                            self._offsets, self._times = list(saved['offsets']), list(saved['times'])
+                            self._size, self._count = int(saved['size']), int(saved['count'])
+                            self._check = saved['check'].tobytes()
+            elif self._size > size or self._index_check(f, self._size) != self._check:
+                self._reset_index()
+            if self._size == size:
+                return
+
+            position, count = self._size, self._count
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # still being written
+                if count % self.index_stride == 0:
+                    self._offsets.append(position)
+                    self._times.append(self._line_time(line))
+                position += len(line)
+                count += 1
+            self._size, self._count = position, count
+            self._check = self._index_check(f, position)
+
+        if self.use_index:
+            tmp = self.filename + '.idx.tmp.npz'
+            np.savez(tmp, offsets=np.array(self._offsets, dtype=np.uint64), times=np.array(self._times, dtype=float),
+                     stride=self.index_stride, size=self._size, count=self._count,
+                     check=np.frombuffer(self._check, dtype=np.uint8))
+            os.replace(tmp, self.filename + '.idx.npz')
+
+    def _reset_index(self):
+        self._offsets, self._times, self._size, self._count, self._check = [], [], 0, 0, b''
+
+    @staticmethod
+    def _index_check(f, size, n=256):
+        """First and last bytes of the first 'size' bytes of binary file 'f'. They change when
+        the file is rewritten, timestamps make a regrown file differ from the one indexed."""
+        f.seek(0)
+        head = f.read(min(size, n))
+        f.seek(max(size - n, 0))
+        return head + f.read(min(size, n))
+
+    def _line_time(self, line):
+        marker = ';{},'.format(self.time_key).encode()
+        line = b';' + line
+        at = line.find(marker)
+        if at < 0:
+            return float('nan')
+        value = line[at + len(marker):line.find(b';', at + len(marker))]
+        try:
+            return float(value)
+        except ValueError:
+            return float('nan')
+
+    def _text_lines(self, start):
+        """Generator of (record number, line bytes) from record 'start' on"""
+        self._update_index()
+        block = start // self.index_stride
+        if block >= len(self._offsets):
+            return
+        n = block * self.index_stride
+        with open(self.filename, 'rb') as f:
+            f.seek(int(self._offsets[block]))
+            for line in f:
+                if n >= self._count:
+                    return
+                if n >= start:
+                    yield n, line
+                n += 1
+
+    def __len__(self):
+        if self.binary:
+            return len(self._rows())
+        self._update_index()
+        return self._count
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        for record in self.records(start=n, stop=n + 1):
+            return record
+        raise IndexError('record {} out of range'.format(n))
+
+    def find_time(self, t):
+        import numpy as np
+        if self.binary:
+            return int(np.searchsorted(self._rows()[self.time_key], t, side='left'))
+        self._update_index()
+        # last indexed block starting before t, then scan it
+        block = max(int(np.searchsorted(np.array(self._times, dtype=float), t, side='left')) - 1, 0)
+        for n, line in self._text_lines(block * self.index_stride):
+            if self._line_time(line) >= t:
+                return n
+        return self._count
+
+    def _range(self, start, stop, t0):
+        length = len(self)
+        start, stop, _ = slice(start, stop).indices(length)
+        if t0 is not None:
+            start = max(start, self.find_time(t0))
+        return start, stop
+
+    def records(self, fields=None, start=None, stop=None, t0=None, t1=None):
+        start, stop = self._range(start, stop, t0)
+        if self.binary:
+            rows = self._rows()
+            names = fields or rows.dtype.names
+            for n in range(start, stop):
+                row = rows[n]
+                if t1 is not None and row[self.time_key] >= t1:
+                    return
+                yield {name: row[name].item() if row[name].ndim == 0 else row[name].copy() for name in names}
+            return
+        for n, line in self._text_lines(start):
+            if n >= stop:
+                return
+            if t1 is not None and self._line_time(line) >= t1:
+                return
+            record = _parse_record(line.decode(), self.convert)
+            yield record if fields is None else {name: record.get(name) for name in fields}
+
+    def columns(self, fields=None, chunk_size=65536, start=None, stop=None, t0=None, t1=None):
+        import numpy as np
+        if self.binary:
+            start, stop = self._range(start, stop, t0)
+            rows = self._rows()
+            if t1 is not None:
+                stop = min(stop, max(start, int(np.searchsorted(rows[self.time_key], t1, side='left'))))
+            names = fields or rows.dtype.names
+            for i in range(start, stop, chunk_size):
+                chunk = rows[i:min(i + chunk_size, stop)]
+                yield {name: np.array(chunk[name]) for name in names}
+            return
+        chunk = []
+        for record in self.records(fields, start, stop, t0, t1):
+            if fields is None:
+                fields = list(record)
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield {name: np.array([r.get(name) for r in chunk]) for name in fields}
+                chunk = []
+        if chunk:
+            yield {name: np.array([r.get(name) for r in chunk]) for name in fields}
+
+
 class LogAndRecord():
     """intended as a superclass. Attaches a logger and/or recorder to a
     subclass for ease of use.
@@ -162,6 +969,8 @@ class LogAndRecord():
             record_file (filename string, see Logger): file to record data to
                 when using .record(data). A Recorder object is created to
                 handle the file.
+            record_format ('text' or 'binary'): 'binary' records with a
+                BinaryRecorder instead, default 'text'
             logger (Logger object): attach a Logger directly for use with
                 .log(msg, level), and .clear_log(N)
 
@@ -190,7 +999,10 @@ class LogAndRecord():
             self.clear_log = self.logger.clear_log
 
         if 'record_file' in kwargs.keys() and kwargs['record_file'] is not None:
-            self.recorder = Recorder(kwargs['record_file'])
+            if kwargs.get('record_format', 'text') == 'binary':
+                self.recorder = BinaryRecorder(kwargs['record_file'])
+            else:
+                self.recorder = Recorder(kwargs['record_file'])
             self.record = self.recorder.log
             self.log('Recording to {}'.format(kwargs['record_file']), logging.INFO)
             self.stop_recording = self.recorder.stop_recording
@@ -237,4 +1049,5 @@ class MultilineFormatter(logging.Formatter):
         return output
 
 
-__all__ = ['Logger', 'Recorder', 'LogAndRecord', 'MultilineFormatter']
+__all__ = ['SegmentedFileHandler', 'find_segments', 'Logger', 'Recorder', 'BinaryRecorder', 'read_recording',
+           'RecorderReader', 'LogAndRecord', 'MultilineFormatter']
@@ -1,5 +1,8 @@
 import pytest
-from generalUtils.color_utils import colorList, rgb_to_hex, hex_to_rgb, findColor
+import random
+from generalUtils.color_utils import colorList, rgb_to_hex, hex_to_rgb, findColor, \
+    hex_to_rgb_array, rgb_to_hex_array, tuple_distance, ColorIndex, \
+    classify_colors, rebuild_color_index
 
 
 def test_rgb_vs_hex():
@@ -10,6 +13,38 @@ def test_rgb_vs_hex():
         assert hex_to_rgb(c[1]) == c[2]
 
 
+def test_rgb_vs_hex_array():
+    import numpy as np
+    hexes = [c[1] for c in colorList]
+    rgbs = np.array([c[2] for c in colorList])
+
+    assert np.array_equal(hex_to_rgb_array(hexes), rgbs)
+    assert hex_to_rgb_array(hexes).dtype == np.uint8
+    assert np.array_equal(hex_to_rgb_array([h[1:].lower() for h in hexes]), rgbs)
+    assert np.array_equal(hex_to_rgb_array(['0x' + h[1:] for h in hexes]), rgbs)
+    assert np.array_equal(hex_to_rgb_array(['0X' + h[1:] for h in hexes]), rgbs)
+    assert hex_to_rgb_array([]).shape == (0, 3)
+    with pytest.raises(ValueError):
+        hex_to_rgb_array(['#F0F0F0', '#F0F0'])
+    with pytest.raises(ValueError):
+        hex_to_rgb_array(['#F0F0F', '#F0F0F0F'])
+    with pytest.raises(ValueError):
+        hex_to_rgb_array(['0xF0F0F0F', 'F0F0F'])
+    with pytest.raises(ValueError):
+        hex_to_rgb_array(['ABCD  ', 'EF    '])  # fromhex skips whitespace
+    with pytest.raises(ValueError):
+        hex_to_rgb_array(['#F0F0F0', 'F0F0G0'])
+    for empty in (['#FFFFFF', ''], [''], ['', '#FFFFFF']):
+        with pytest.raises(ValueError):
+            hex_to_rgb_array(empty)
+
+    assert rgb_to_hex_array(rgbs, '#') == hexes
+    assert rgb_to_hex_array(rgbs.astype(np.uint8)) == [rgb_to_hex(c[2]) for c in colorList]
+    assert rgb_to_hex_array([c[2] for c in colorList]) == [rgb_to_hex(c[2]) for c in colorList]
+    with pytest.raises(ValueError):
+        rgb_to_hex_array([(0, 0, 256)])
+
+
 def test_findColor():
     # check all colors in colorList
     for C in colorList:
@@ -20,9 +55,127 @@ def test_findColor():
         for c in clist:
             assert findColor(c) == C
 
+        # names and hex strings are case insensitive, hex accepts '0x'
+        for n in C[0]:
+            assert findColor(n.upper()) == C
+        assert findColor(C[1].lower()) == C
+        assert findColor('0x' + C[1][1:].lower()) == C
+
     # check all colors in colorList
     for c in colorList:
         # adjust rgb values slightly to test the search algorithm (which gets closest by rgb tuple_distance)
         assert c == findColor((c[2][0]+2, c[2][1]-2, c[2][2]))
         assert c == findColor((c[2][0], c[2][1]+2, c[2][2]-2))
         assert c == findColor((c[2][0]-2, c[2][1], c[2][2]+2))
+
+
+def test_ColorIndex():
+    random.seed(0)
+
+    # user palette, with duplicate colors to check ties go to the first entry
+    palette = [([str(i)], '', tuple(random.randrange(0, 256, 8) for _ in range(3))) for i in range(3000)]
+    index = ColorIndex(palette)
+    assert not index._trees  # built on first use
+
+    for _ in range(300):
+        rgb = tuple(random.randrange(256) for _ in range(3))
+        distances = [tuple_distance(rgb, c[2]) for c in palette]
+        assert index.nearest_index(rgb) == distances.index(min(distances))
+        assert index.nearest(rgb) is palette[distances.index(min(distances))]
+
+    # default palette
+    index = ColorIndex()
+    for _ in range(300):
+        rgb = tuple(random.randrange(256) for _ in range(3))
+        distances = [tuple_distance(rgb, c[2]) for c in colorList]
+        assert index.nearest(rgb) == colorList[distances.index(min(distances))]
+
+    with pytest.raises(ValueError):
+        ColorIndex([]).nearest((0, 0, 0))
+
+
+def test_classify_colors():
+    import numpy as np
+    rng = np.random.RandomState(0)
+
+    # (H, W, 3) image, plus every colorList color and a nudged copy
+    image = rng.randint(0, 256, (20, 150, 3)).astype(np.uint8)
+    exact = np.array([c[2] for c in colorList], dtype=np.uint8)
+    image[0, :len(exact)] = exact
+    image[1, :len(exact)] = np.clip(exact.astype(int) + [2, -2, 0], 0, 255)
+
+    expected = [[colorList.index(findColor(tuple(int(v) for v in px))) for px in row] for row in image]
+    assert np.array_equal(classify_colors(image), expected)
+    assert np.array_equal(classify_colors(image, chunk_size=77, workers=4), expected)
+    assert np.array_equal(classify_colors(image.reshape(-1, 3).astype(float)), np.ravel(expected))
+
+    # user palette
+    palette = [([str(i)], '', tuple(int(v) for v in rng.randint(0, 256, 3))) for i in range(500)]
+    index = ColorIndex(palette)
+    pixels = image.reshape(-1, 3)[:300]
+    assert list(classify_colors(pixels, index)) == [index.nearest_index(tuple(int(v) for v in px)) for px in pixels]
+
+
+def test_extend_colorList():
+    new_color = (['not-quite-black'], '#010203', (1, 2, 3))
+    assert findColor('not-quite-black') is None
+    assert findColor((1, 2, 3))[0] == ['black']
+
+    colorList.append(new_color)
+    try:
+        # appending is noticed
+        assert findColor('not-quite-black') == new_color
+        assert findColor('#010203') == new_color
+        assert findColor((1, 2, 3)) == new_color
+        assert findColor((1, 2, 4)) == new_color
+
+        # editing in place needs a rebuild
+        colorList[-1] = (['nearly-black'], '#010203', (1, 2, 3))
+        rebuild_color_index()
+        assert findColor('not-quite-black') is None
+        assert findColor('nearly-black') == colorList[-1]
+    finally:
+        colorList.pop()
+    assert findColor('nearly-black') is None
+    assert findColor((1, 2, 3))[0] == ['black']
+
+
+def test_metrics():
+    import numpy as np
+    from generalUtils.color_utils import METRICS, color_distance, rgb_to_lab
+
+    # reference values
+    assert np.allclose(rgb_to_lab((255, 255, 255)), (100, 0, 0), atol=1e-3)
+    assert np.allclose(rgb_to_lab((255, 0, 0)), (53.2408, 80.0925, 67.2032), atol=1e-3)
+    from generalUtils.color_utils import _ciede2000
+    assert np.isclose(_ciede2000((50, 2.6772, -79.7751), (50, 0, -82.7485)), 2.0425, atol=1e-4)
+    assert np.isclose(_ciede2000((50, 2.5, 0), (73, 25, -18)), 27.1492, atol=1e-4)
+    assert color_distance((1, 2, 3), (4, 6, 3)) == 5
+    assert color_distance((1, 2, 3), (4, 6, 3), 'sqeuclidean') == 25
+    with pytest.raises(ValueError):
+        color_distance((1, 2, 3), (4, 6, 3), 'manhattan')
+
+    rng = np.random.RandomState(1)
+    pixels = rng.randint(0, 256, (400, 3)).astype(np.uint8)
+    for metric in METRICS:
+        # exact matches regardless of metric
+        for C in colorList:
+            assert findColor(C[2], metric) == C
+
+        distances = [[color_distance(tuple(int(v) for v in px), c[2], metric) for c in colorList] for px in pixels]
+        expected = [d.index(min(d)) for d in distances]
+        assert [colorList.index(findColor(tuple(int(v) for v in px), metric)) for px in pixels] == expected
+        assert list(classify_colors(pixels, metric=metric, chunk_size=150)) == expected
+
+    # repeated pixels, integer and float pixels, and exact ties between palette entries
+    palette = [(['a'], '', (10, 20, 30)), (['b'], '', (200, 100, 0)), (['c'], '', (10, 20, 30))]
+    index = ColorIndex(palette)
+    many = np.concatenate([pixels, pixels[::-1], [(10, 20, 30)] * 3])
+    for metric in METRICS:
+        expected = [index.nearest_index(tuple(int(v) for v in px), metric) for px in many]
+        assert expected[-1] == 0
+        assert list(classify_colors(many, index, metric=metric, chunk_size=300)) == expected
+        assert list(classify_colors(many.astype(int), index, metric=metric)) == expected
+        assert list(classify_colors(many.astype(float), index, metric=metric)) == expected
+        assert np.array_equal(classify_colors(many[:800].reshape(20, 40, 3), index, metric=metric, chunk_size=300),
+                              np.reshape(expected[:800], (20, 40)))
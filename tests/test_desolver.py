@@ -1,10 +1,11 @@
 import pytest
-import os, sys, logging, json
+import os, sys, logging, json, asyncio
 from scipy.optimize import rosen
 import numpy as np
 import time
 from tqdm import tqdm
-from generalUtils.differential_evolver import DESolver
+from generalUtils.differential_evolver import DESolver, AsyncDESolver, DEArchipelago, Progress, LogProgress, \
+    StagnationMonitor, DiversityMonitor, TimeBudgetMonitor
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 
@@ -184,3 +185,403 @@ def test_tqdm_resume_interrupted():
     assert des.pbar_feval.n == 41
     assert des.pbar_gen_mutations.n == 1
     assert np.isclose(des.pbar_gens.n, 3.0+1/10)
+
+
+def test_parallel():
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=30, seed=1)
+    serial = DESolver(rosen, updating='deferred', **kwargs)
+    serial_evals = []
+    serial.feval_callback = lambda solver, x, y, *args: serial_evals.append(y)
+    res = serial.solve()
+
+    for pool in ['thread', 'process']:
+        evals = []
+        des = DESolver(rosen, workers=2, pool=pool, **kwargs)
+        des.feval_callback = lambda solver, x, y, *args: evals.append(y)
+        assert des.solve().fun == res.fun
+        assert np.array_equal(des.X, serial.X)
+        # callbacks happen in this process
+        assert evals == serial_evals
+        assert des._nfev == serial._nfev
+
+        # resumed solver stays parallel
+        state = des.state
+        assert state['workers'] == 2
+        assert state['pool'] == pool
+        resumed = DESolver(rosen, **state)
+        next(resumed)
+        assert resumed._executor is not None
+        resumed.close()
+
+
+def test_vectorized():
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=30, seed=1, updating='deferred')
+    serial = DESolver(rosen, **kwargs)
+    serial_evals = []
+    serial.feval_callback = lambda solver, x, y, *args: serial_evals.append(y)
+    res = serial.solve()
+
+    calls = []
+    des = DESolver(rosen, vectorized=True, **kwargs)
+    des.feval_callback = lambda solver, x, y, *args: calls.append((x, y))
+    assert des.solve().fun == res.fun
+    assert np.array_equal(des.X, serial.X)
+    assert des._nfev == serial._nfev
+
+    # one call per generation, with every member
+    assert len(calls) == 31
+    assert calls[0][0].shape == (30, 5)
+    assert np.array_equal(np.concatenate([y for x, y in calls]), serial_evals)
+    assert DESolver(rosen, **des.state).vectorized
+
+    des = DESolver(rosen, vectorized=True, p_bars=True, **kwargs)
+    des.solve()
+    assert des.pbar_feval.n == serial._nfev + des.num_population_members
+
+
+def test_checkpoint():
+    filename = 'test_checkpoint'
+    clear_file(filename)
+
+    for seed in [1, np.random.default_rng(2)]:
+        des = DESolver(rosen, bounds=[(0, 2)] * 5, popsize=6, seed=seed)
+        for i in range(5):
+            next(des)
+        des.save_checkpoint(filename)
+        for i in range(5):
+            next(des)
+
+        # continues exactly the same
+        loaded = DESolver.load_checkpoint(filename, rosen)
+        assert loaded._nfev == des._nfev - 5 * des.num_population_members
+        for i in range(5):
+            next(loaded)
+        assert np.array_equal(loaded.population, des.population)
+        assert np.array_equal(loaded.Y, des.Y)
+        assert loaded._nfev == des._nfev
+
+        # settings can be changed
+        assert DESolver.load_checkpoint(filename, rosen, maxiter=7).maxiter == 7
+
+    clear_file(filename)
+
+
+def test_autosave():
+    filename = 'test_autosave'
+    for f in [filename, filename + '.prev']:
+        clear_file(f)
+
+    des = DESolver(rosen, bounds=[(0, 2)] * 5, popsize=6, seed=1, autosave=filename, autosave_gens=2)
+    nfevs = []
+    for i in range(4):
+        next(des)
+        des.close()  # wait for the write
+        nfevs.append(des._nfev)
+    assert os.path.exists(filename) and os.path.exists(filename + '.prev')
+    des.autosave = None
+    for i in range(3):
+        next(des)
+
+    # latest snapshot, generation 4
+    assert DESolver.resume(filename, rosen).autosave == filename
+    resumed = DESolver.resume(filename, rosen, autosave=None)
+    assert resumed._nfev == nfevs[3]
+    for i in range(3):
+        next(resumed)
+    assert np.array_equal(resumed.population, des.population)
+    resumed.close()
+    des.close()
+
+    # unreadable latest snapshot falls back to the one before
+    with open(filename, 'wb') as f:
+        f.write(b'partial')
+    assert DESolver.resume(filename, rosen)._nfev == nfevs[1]
+
+    os.remove(filename)
+    os.remove(filename + '.prev')
+    with pytest.raises(FileNotFoundError):
+        DESolver.resume(filename, rosen)
+
+    # saved at the end of solve
+    des = DESolver(rosen, bounds=[(0, 2)] * 5, popsize=6, seed=1, maxiter=5, autosave=filename, autosave_secs=1e6)
+    des.solve()
+    assert DESolver.resume(filename, rosen)._nfev == des._nfev
+
+    # errors making the solver are raised, not taken for an unreadable file
+    with pytest.raises(TypeError):
+        DESolver.resume(filename, rosen, popsiz=3)
+    # a cut off file falls back too
+    with open(filename, 'rb') as f:
+        data = f.read()
+    with open(filename + '.prev', 'wb') as f:
+        f.write(data)
+    with open(filename, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    assert DESolver.resume(filename, rosen, autosave=None)._nfev == des._nfev
+
+    for f in [filename, filename + '.prev']:
+        clear_file(f)
+
+
+def test_cache():
+    calls = []
+
+    def counted(x):
+        calls.append(np.shape(x)[-1] if np.ndim(x) > 1 else 1)
+        return rosen(x)
+
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=30, seed=1)
+    res = DESolver(rosen, **kwargs).solve()
+
+    # exact keys give the same results
+    des = DESolver(rosen, cache=True, **kwargs)
+    assert des.solve().fun == res.fun
+    assert des.cache.misses > 0
+
+    for extra in [dict(), dict(updating='deferred'), dict(vectorized=True), dict(workers=2, pool='thread')]:
+        calls.clear()
+        des = DESolver(counted, cache=100, cache_tol=0.5, **kwargs, **extra)
+        next(des)
+        calls0, nfev0 = sum(calls), des._nfev
+        for i in range(10):
+            next(des)
+        des.close()
+        # hits are not evaluations
+        assert des.cache.hits > 0
+        assert sum(calls) - calls0 == des._nfev - nfev0
+        assert len(des.cache) <= 100
+
+    # persisted with state and checkpoints
+    des = DESolver(rosen, cache=True, cache_persist=True, **kwargs)
+    for i in range(3):
+        next(des)
+    state = json.loads(json.dumps(des.state))
+    assert len(DESolver(rosen, **state).cache) == len(des.cache)
+    filename = 'test_cache'
+    des.save_checkpoint(filename)
+    loaded = DESolver.load_checkpoint(filename, rosen)
+    assert np.array_equal(loaded.cache.to_arrays()[0], des.cache.to_arrays()[0])
+    clear_file(filename)
+
+    # not persisted by default
+    des = DESolver(rosen, cache=True, **kwargs)
+    next(des)
+    assert 'cache_data' not in des.state
+    assert len(DESolver(rosen, **des.state).cache) == 0
+
+
+def test_progress():
+    class Recorded(Progress):
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.refreshes = []
+
+        def refresh(self):
+            self.refreshes.append((self.fevals, self.generation, self.mutations))
+
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=5, seed=1)
+
+    # refreshed only at the start, generation boundaries and close when evaluations are quick
+    progress = Recorded(1e6)
+    des = DESolver(rosen, progress=progress, **kwargs)
+    des.solve()
+    assert len(progress.refreshes) == 1 + 5 + 1
+    # every evaluation, nfev leaves out the initial population
+    assert progress.refreshes[-1][0] == des._nfev + des.num_population_members
+    assert [r[1] for r in progress.refreshes[1:-1]] == [1, 2, 3, 4, 5]
+
+    # refreshed while counting when due
+    progress = Recorded(0)
+    des = DESolver(rosen, progress=progress, **kwargs)
+    des.solve()
+    assert len(progress.refreshes) > des._nfev
+
+    # same accounting as p_bars
+    des_bars = DESolver(rosen, p_bars=True, **kwargs)
+    des_bars.solve()
+    assert des_bars._nfev == des_bars.pbar_feval.n == progress.fevals
+    assert np.isclose(des_bars.pbar_gens.n, progress.generation)
+
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('test_progress')
+    logger.addHandler(handler)
+    des = DESolver(rosen, progress=LogProgress(logger, logging.WARNING), **kwargs)
+    des.solve()
+    # at start and close
+    assert len(records) == 2
+    assert records[-1].getMessage().startswith('F-Evals: {}/'.format(des._nfev + des.num_population_members))
+    assert 'progress' not in des.state
+
+
+def test_progress_observes():
+    # a progress sink does not change nfev or, through maxfun, the result
+    for kwargs in (dict(maxiter=5), dict(maxfun=23)):
+        kwargs.update(bounds=[(0, 2)] * 5, popsize=2, seed=1)
+        plain = DESolver(rosen, **kwargs).solve()
+        for progress in (Progress(), LogProgress()):
+            res = DESolver(rosen, progress=progress, **kwargs).solve()
+            assert res.nfev == plain.nfev
+            assert res.fun == plain.fun and np.array_equal(res.x, plain.x)
+
+
+def test_archipelago():
+    kwargs = dict(bounds=[(0, 2)] * 5, islands=3, migration_interval=4, migrants=2, maxiter=12, seed=1, popsize=5)
+
+    local = DEArchipelago(rosen, processes=False, **kwargs)
+    res = local.solve()
+    assert res.nit == 12
+    assert res.fun == min(res.islands)
+    assert res.fun == rosen(res.x)
+    assert res.nfev == local.nfev > 0
+    assert not res.success
+
+    # same in processes
+    with DEArchipelago(rosen, **kwargs) as processes:
+        assert processes.solve().fun == res.fun
+        assert processes.nfev == res.nfev
+
+    # resume from state, in between migrations
+    first = DEArchipelago(rosen, processes=False, **kwargs)
+    next(first)
+    next(first)
+    state = json.loads(json.dumps(first.state))
+    assert len(state['islands']) == 3
+    resumed = DEArchipelago(rosen, **state)
+    assert resumed.y == first.y
+    assert resumed.generation == 8
+    resumed_res = resumed.solve()
+    assert resumed_res.nit == 12
+    assert resumed_res.fun <= first.y
+
+    # the best member is sent to the next island
+    local = DEArchipelago(rosen, processes=False, **kwargs)
+    x, y = next(local)
+    populations = [island.solver.X for island in local._islands]
+    home = [i for i, X in enumerate(populations) if np.any(np.all(X == x, axis=1))]
+    assert len(home) == 2
+
+    isolated = DEArchipelago(rosen, processes=False, **dict(kwargs, migrants=0))
+    next(isolated)
+    assert sum(np.any(np.all(island.solver.X == isolated.x, axis=1)) for island in isolated._islands) == 1
+
+
+def test_monitors():
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=2000, seed=1, tol=0)
+
+    des = DESolver(rosen, monitors=[StagnationMonitor(window=20, rtol=1e-3)], **kwargs)
+    res = des.solve()
+    assert res.nit < 2000
+    assert res.success
+    assert res.message.startswith('Best energy improved by')
+    assert [e['action'] for e in res.monitor_events] == ['stop']
+    assert res.monitor_events[0]['nfev'] == res.nfev
+
+    # restart keeps the best member, then stops after max_restarts
+    des = DESolver(rosen, monitors=[StagnationMonitor(window=20, rtol=1e-3, action='restart', max_restarts=2)],
+                   **kwargs)
+    res = des.solve()
+    assert [e['action'] for e in res.monitor_events] == ['restart', 'restart', 'stop']
+    energies = [e['energy'] for e in res.monitor_events]
+    assert energies == sorted(energies, reverse=True)
+    assert res.fun == energies[-1]
+
+    des = DESolver(rosen, monitors=[DiversityMonitor(threshold=0.05)], **kwargs)
+    res = des.solve()
+    assert res.message.startswith('Population diversity')
+    assert np.mean(np.std(des.population, axis=0)) < 0.05
+
+    des = DESolver(lambda x: [rosen(x), time.sleep(.001)][0], monitors=[TimeBudgetMonitor(0.2)], **kwargs)
+    start = time.monotonic()
+    res = des.solve()
+    assert not res.success
+    assert time.monotonic() - start < 1
+    assert res.message == 'Wall-clock budget of 0.2 seconds used.'
+
+
+def test_history():
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=10, seed=1)
+
+    for extra in [dict(), dict(vectorized=True), dict(workers=2, pool='thread')]:
+        evals = []
+        des = DESolver(rosen, history=16, **kwargs, **extra)  # grows a few times
+        des.feval_callback = lambda solver, x, y, *args: evals.append((np.copy(x), y))
+        des.solve()
+        x = np.concatenate([np.reshape(x, (-1, 5)) for x, y in evals])
+        y = np.concatenate([np.ravel(y) for x, y in evals])
+        assert np.array_equal(des.history.x, x)
+        assert np.array_equal(des.history.y, y)
+
+        stats = des.history.generation_stats
+        assert len(stats) == 10
+        assert stats['nfev'][-1] == len(des.history)
+        assert stats['best'][-1] == des.y
+        assert np.all(np.diff(stats['best']) <= 0)
+        assert stats['min'][-1] == des.history.y[stats['nfev'][-2]:].min()
+
+    filename = 'test_history.npy'
+    des.history.save(filename)
+    records = np.load(filename)
+    assert np.array_equal(records['x'], des.history.x)
+    assert np.array_equal(records['y'], des.history.y)
+    clear_file(filename)
+
+    # memory-mapped
+    des = DESolver(rosen, history=16, history_path=filename, **kwargs)
+    des.solve()
+    des.history.flush()
+    mapped = np.load(filename)
+    assert len(mapped) >= len(des.history)
+    assert np.array_equal(mapped['y'][:len(des.history)], des.history.y)
+    assert not os.path.exists(filename + '.tmp')
+    del des, mapped
+    clear_file(filename)
+
+
+def test_async():
+    running, peaks = [], []
+
+    async def objective(x):
+        await asyncio.sleep(0.001)
+        return rosen(x)
+
+    async def peak_objective(x):
+        running.append(1)
+        await asyncio.sleep(0.001)
+        peaks.append(len(running))
+        running.pop()
+        return rosen(x)
+
+    kwargs = dict(bounds=[(0, 2)] * 5, popsize=6, maxiter=10, seed=1)
+    serial = DESolver(rosen, updating='deferred', **kwargs)
+    serial_evals = []
+    serial.feval_callback = lambda solver, x, y, *args: serial_evals.append(y)
+    res = serial.solve()
+
+    evals = []
+    des = AsyncDESolver(objective, concurrency=4, **kwargs)
+    des.feval_callback = lambda solver, x, y, *args: evals.append(y)
+    assert des.solve().fun == res.fun
+    assert np.array_equal(des.X, serial.X)
+    assert des._nfev == serial._nfev
+    # in the order they complete
+    assert sorted(evals) == sorted(serial_evals)
+    assert des._loop is None
+
+    # concurrency limit
+    des = AsyncDESolver(peak_objective, concurrency=4, **kwargs)
+    start = time.monotonic()
+    des.solve()
+    assert max(peaks) == 4
+    assert time.monotonic() - start < len(peaks) * 0.001
+
+    # resumes as an AsyncDESolver
+    state = json.loads(json.dumps(des.state))
+    assert state['concurrency'] == 4 and 'workers' not in state
+    resumed = AsyncDESolver(objective, **state)
+    next(resumed)
+    resumed.close()
+
+    with pytest.raises(ValueError):
+        AsyncDESolver(objective, vectorized=True, **kwargs)
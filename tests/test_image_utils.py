@@ -1,35 +1,305 @@
 import numpy as np
-from generalUtils.image_utils import draw_circle
-import cv2
-
-# for fill in list(range(0,20,3)):
-#     for r in list(range(1,27,5)):
-#         blank = np.zeros([100, 100])
-#         circle(blank, [50,50], r, 255, fill)
-#         bb = blur(blank, r*1.2+2)
-#         grad = np.gradient(bb)
-#         grad_mag = np.sqrt(np.power(grad[0],2) + np.power(grad[1],2))
-#         plot3d(range(100), range(100), bb).show()
-#         # plot3d(range(100), range(100), grad_mag).show()
-#         cv2.imshow('blank',blank)
-#         cv2.imshow('bb',bb)
-#         cv2.imshow('g',grad_mag)
-#         cv2.waitKey(0)
-#         # time.sleep(100)
-
-
-for fill in list(range(-1,20,3)):
-    blank = np.zeros([800, 800])
-    draw_circle(blank, [400,400], 380, 1, fill)
-    cv2.imshow('',blank)
-    cv2.waitKey(200)
-
-for r in range(0,50, 10):
-    for x in range(-5,170, 20):
-        for y in range(-5, 90, 20):
-    # for fill in [-1]:
-            for fill in list(range(-1,10,3)):
-                blank = np.zeros([71,151])
-                draw_circle(blank,[x,y], r, 1, fill)
-                cv2.imshow('',blank)
-                cv2.waitKey(50)
\ No newline at end of file
+import pytest
+from generalUtils import image_utils
+from generalUtils.image_utils import draw_circle, draw_circles, flatten, _saturate
+
+
+class Layer(np.ndarray):
+    pass
+
+
+def make_layer(values, x, y, offset=0, alpha=None):
+    layer = np.array(values).view(Layer)
+    layer.x, layer.y, layer.offset = x, y, offset
+    if alpha is not None:
+        layer.alpha = alpha
+    return layer
+
+
+def flatten_per_pixel(base, *layers):
+    """flatten before it used slices, one base[y][x] + val at a time"""
+    for mask in layers[::-1]:
+        startx, starty = int(mask.x + mask.offset), int(mask.y + mask.offset)
+        [[base[r + starty].__setitem__(c + startx, base[r + starty][c + startx] + val)
+          for c, val in enumerate(row) if c + startx >= 0 and c + startx < base.shape[1]]
+         for r, row in enumerate(mask) if r + starty >= 0 and r + starty < base.shape[0]]
+    return base
+
+
+def blend_per_pixel(base, mode, *layers):
+    """flatten one pixel at a time, in float64, rounded and clipped into integer bases"""
+    out = base.astype(float)
+    for layer in layers[::-1]:
+        startx, starty = int(layer.x + layer.offset), int(layer.y + layer.offset)
+        alpha = np.broadcast_to(getattr(layer, 'alpha', 1.0), layer.shape[:2])
+        for r in range(layer.shape[0]):
+            for c in range(layer.shape[1]):
+                y, x = r + starty, c + startx
+                if 0 <= y < base.shape[0] and 0 <= x < base.shape[1]:
+                    b, v, a = out[y, x], np.asarray(layer)[r, c], alpha[r, c]
+                    if mode == 'max':
+                        out[y, x] = np.maximum(b, v)
+                    elif mode == 'over':
+                        out[y, x] = b + (v - b) * a
+                    else:
+                        out[y, x] = b + v
+                    if base.dtype.kind in 'iu':
+                        info = np.iinfo(base.dtype)
+                        out[y, x] = np.clip(np.rint(out[y, x]), info.min, info.max)
+    return out
+
+
+# layers that hang off every edge, fit inside, and miss the base entirely
+PLACEMENTS = [(-3, -2, 0), (8, 5, 0), (2, 3, 1), (-20, 4, 0), (14, -1, -1), (0, 0, 0)]
+
+
+def layers_for(dtype, channels, rng):
+    shape = (5, 7) + ((channels,) if channels else ())
+    high = 50 if np.dtype(dtype).kind in 'iu' else 1.0
+    return [make_layer((rng.uniform(0, high, shape)).astype(dtype), x, y, offset) for x, y, offset in PLACEMENTS]
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.float32, np.float64])
+@pytest.mark.parametrize('channels', [None, 3])
+def test_flatten_add_matches_per_pixel(dtype, channels):
+    rng = np.random.RandomState(0)
+    shape = (12, 15) + ((channels,) if channels else ())
+    base = (rng.uniform(0, 100, shape)).astype(dtype)
+    layers = layers_for(dtype, channels, rng)
+
+    expected = flatten_per_pixel(base.copy(), *layers)
+    result = base.copy()
+    assert flatten(result, *layers) is result
+    assert result.dtype == base.dtype
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('layer_dtype', [np.float64, np.int64, np.int32, np.uint8])
+def test_flatten_add_mixed_dtypes(layer_dtype):
+    rng = np.random.RandomState(1)
+    base = rng.randint(0, 100, (12, 15)).astype(np.uint8)
+    layers = [make_layer(rng.randint(0, 50, (5, 7)).astype(layer_dtype), x, y, offset)
+              for x, y, offset in PLACEMENTS]
+    expected = flatten_per_pixel(base.copy(), *layers)
+    assert np.array_equal(flatten(base.copy(), *layers), expected)
+
+
+@pytest.mark.parametrize('mode', ['add', 'max', 'over'])
+@pytest.mark.parametrize('dtype', [np.uint8, np.float32])
+def test_flatten_modes(mode, dtype):
+    rng = np.random.RandomState(2)
+    base = (rng.uniform(0, 100, (12, 15))).astype(dtype)
+    layers = layers_for(dtype, None, rng)
+    layers[1].alpha = 0.25
+    layers[2].alpha = rng.uniform(0, 1, layers[2].shape)
+
+    expected = blend_per_pixel(base, mode, *layers)
+    result = flatten(base.copy(), *layers, mode=mode)
+    assert np.allclose(result, expected, atol=1 if dtype == np.uint8 else 1e-4)
+
+    with pytest.raises(ValueError):
+        flatten(base, *layers, mode='multiply')
+    with pytest.raises(ValueError):
+        flatten(base, *layers, mode='saturate')  # 'add' saturates
+
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.int16])
+@pytest.mark.parametrize('layer_dtype', ['same', np.float64, np.int64])
+def test_flatten_add_saturates(dtype, layer_dtype):
+    info = np.iinfo(dtype)
+    base = np.array([[info.max - 5, info.max, 10, info.min]] * 2, dtype=dtype)
+    values = np.array([[3, 20, 7, -3]] * 2)
+    if layer_dtype == 'same':
+        values, layer_dtype = np.clip(values, info.min, info.max), dtype
+    layer = make_layer(values.astype(layer_dtype), 0, 0)
+    expected = np.clip(base.astype(np.int64) + np.asarray(layer).astype(np.int64), info.min, info.max)
+    result = flatten(base.copy(), layer)
+    assert result.dtype == base.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_flatten_channels():
+    rng = np.random.RandomState(3)
+    base = rng.randint(0, 200, (12, 15, 3)).astype(np.uint8)
+    gray = make_layer(rng.randint(0, 100, (5, 7)).astype(np.uint8), 8, 9)
+    color = make_layer(rng.randint(0, 100, (5, 7, 3)).astype(np.uint8), -2, 1, alpha=rng.uniform(0, 1, (5, 7)))
+
+    # 2D layers and alpha apply to every channel, same as flattening each channel on its own
+    for mode in ('add', 'max', 'over'):
+        result = flatten(base.copy(), gray, color, mode=mode)
+        for c in range(3):
+            channel = make_layer(np.asarray(color)[..., c], color.x, color.y, alpha=color.alpha)
+            assert np.array_equal(result[..., c], flatten(base[..., c].copy(), gray, channel, mode=mode))
+
+
+def test_saturate():
+    # floats are rounded half to even, then clipped
+    values = np.array([-3.5, 0.4, 2.5, 254.6, 300.0])
+    assert np.array_equal(_saturate(values, np.uint8), [0, 0, 2, 255, 255])
+    assert np.array_equal(_saturate(np.array([-1, 70000]), np.uint16), [0, 65535])
+    assert np.array_equal(_saturate(np.array([-40000.2, 40000.0]), np.int16), [-32768, 32767])
+    assert _saturate(np.float64(-2.6), np.uint8) == 0
+
+    # in place when possible, untouched for float and matching dtypes
+    values = np.array([1.6, 400.0])
+    assert _saturate(values, np.uint8) is values
+    same = np.array([1, 2], dtype=np.uint8)
+    assert _saturate(same, np.uint8) is same
+    floats = np.array([1.6, 400.0])
+    assert _saturate(floats, np.float32) is floats
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.float32])
+def test_draw_circles_dtypes(dtype):
+    img = np.zeros((40, 50), dtype=dtype)
+    expected = np.zeros((40, 50), dtype=float)
+    draw_circle(expected, (20, 15), 8, 1, -1)
+    mask = expected == 1
+
+    too_big = 70000.6 if dtype == np.uint16 else 300.6
+    for color, value in ((too_big, np.iinfo(dtype).max if dtype != np.float32 else np.float32(too_big)),
+                         (-5.0, 0 if dtype != np.float32 else -5.0), (7.5, 8 if dtype != np.float32 else 7.5)):
+        img[...] = 0
+        assert draw_circle(img, (20, 15), 8, color, -1) is img
+        assert img.dtype == dtype
+        assert np.all(img[mask] == value) and np.all(img[~mask] == 0)
+
+
+@pytest.mark.parametrize('thickness', [None, 1, 3, -1])
+def test_draw_circles_channels(thickness):
+    rng = np.random.RandomState(4)
+    centers = rng.randint(-5, 55, (30, 2))
+    radii = rng.randint(0, 9, 30)
+
+    # one color for every channel, a (C,) color, and (N, C) colors per circle
+    for colors in (200, [10, 300, -2], rng.randint(0, 256, (30, 3))):
+        img = np.zeros((40, 50, 3), dtype=np.uint8)
+        assert draw_circles(img, centers, radii, colors, thickness) is img
+        per_channel = np.broadcast_to(_saturate(np.array(colors), np.uint8), (30, 3))
+        for c in range(3):
+            channel = draw_circles(np.zeros((40, 50), dtype=np.uint8), centers, radii, per_channel[:, c], thickness)
+            assert np.array_equal(img[..., c], channel)
+
+
+def test_draw_circles_matches_draw_circle():
+    rng = np.random.RandomState(5)
+    centers, radii, colors = rng.randint(-5, 55, (20, 2)), rng.randint(0, 9, 20), rng.uniform(0, 1, 20)
+    for thickness in (None, 1, 4, -1):
+        img = np.zeros((40, 50))
+        for center, radius, color in zip(centers, radii, colors):
+            draw_circle(img, center, radius, color, thickness)
+        assert np.array_equal(draw_circles(np.zeros((40, 50)), centers, radii, colors, thickness), img)
+
+
+def draw_circle_midpoint(img, center, radius, color, thickness=None):
+    """draw_circle before it was vectorized, the midpoint circle algorithm pixel by pixel"""
+    height, width = img.shape
+    xc, yc = center
+
+    xc, yc, radius, thickness = int(xc), int(yc), int(radius), int(thickness) if thickness is not None else 0
+
+    def fill_line(x0, x1, y):
+        if y>=0 and y < height:
+            minx, maxx = max(min(x0,width), 0), min(max(x1,0), width)
+            img[y, minx:maxx] = color
+
+    def color_pixel(x, y):
+        if x >= 0 and y >= 0 and x < width and y < height:
+            img[y][x] = color
+
+    thickness = thickness if (thickness is not None and thickness != 0) else 1
+
+    if thickness>1:
+        draw_circle_midpoint(img, center, radius+thickness, color, -1)
+        draw_circle_midpoint(img, center, radius, 0, -1)
+    else:
+        dx, dy = radius, 0
+        err = 1 - dx
+
+        if thickness == 1:
+            while dx >= dy:
+                for x, y in ((dx, dy), (dy, dx), (-dy, dx), (-dx, dy), (-dx, -dy), (-dy, -dx), (dx, -dy), (dy, -dx)):
+                    color_pixel(x + xc, y + yc)
+                dy += 1
+                if (err < 0):
+                    err += 2 * dy + 1
+                else:
+                    dx -= 1
+                    err += 2 * (dy - dx + 1)
+        else:
+            while (dx >= dy):
+                fill_line(xc - dx, xc + dx, yc + dy)
+                fill_line(xc - dx, xc + dx, yc - dy)
+                fill_line(xc - dy, xc + dy, yc + dx)
+                fill_line(xc - dy, xc + dy, yc - dx)
+                dy += 1
+                if (err < 0):
+                    err += 2 * dy + 1
+                else:
+                    dx -= 1
+                    err += 2 * (dy - dx + 1)
+    return img
+
+
+@pytest.mark.parametrize('thickness', [None, 0, 1, 2, 5, -1])
+def test_draw_circle_matches_midpoint(thickness):
+    # on a blank image, the old rings cleared their inside which was blank already
+    for radius in (0, 1, 2, 3, 7, 12, 25):
+        for center in ((30, 25), (2, 3), (58, 44), (-4, 20)):
+            expected = draw_circle_midpoint(np.zeros((50, 60)), center, radius, 1, thickness)
+            assert np.array_equal(draw_circle(np.zeros((50, 60)), center, radius, 1, thickness), expected)
+
+
+def test_draw_circles_batches(monkeypatch):
+    rng = np.random.RandomState(6)
+    centers, radii, colors = rng.randint(-5, 55, (200, 2)), rng.randint(0, 9, 200), rng.randint(1, 256, 200)
+    for thickness in (1, -1, rng.choice([1, 3, -1], 200)):
+        expected = draw_circles(np.zeros((40, 50), dtype=np.uint8), centers, radii, colors, thickness)
+        for batch in (1, 50, 1000):
+            monkeypatch.setattr(image_utils, '_DRAW_BATCH', batch)
+            img = draw_circles(np.zeros((40, 50), dtype=np.uint8), centers, radii, colors, thickness)
+            assert np.array_equal(img, expected)
+        monkeypatch.undo()
+
+
+if __name__ == '__main__':
+    import cv2
+
+    # for fill in list(range(0,20,3)):
+    #     for r in list(range(1,27,5)):
+    #         blank = np.zeros([100, 100])
+    #         circle(blank, [50,50], r, 255, fill)
+    #         bb = blur(blank, r*1.2+2)
+    #         grad = np.gradient(bb)
+    #         grad_mag = np.sqrt(np.power(grad[0],2) + np.power(grad[1],2))
+    #         plot3d(range(100), range(100), bb).show()
+    #         # plot3d(range(100), range(100), grad_mag).show()
+    #         cv2.imshow('blank',blank)
+    #         cv2.imshow('bb',bb)
+    #         cv2.imshow('g',grad_mag)
+    #         cv2.waitKey(0)
+    #         # time.sleep(100)
+
+    for fill in list(range(-1,20,3)):
+        blank = np.zeros([800, 800])
+        draw_circle(blank, [400,400], 380, 1, fill)
+        cv2.imshow('',blank)
+        cv2.waitKey(200)
+
+    for r in range(0,50, 10):
+        for x in range(-5,170, 20):
+            for y in range(-5, 90, 20):
+        # for fill in [-1]:
+                for fill in list(range(-1,10,3)):
+                    blank = np.zeros([71,151])
+                    draw_circle(blank,[x,y], r, 1, fill)
+                    cv2.imshow('',blank)
+                    cv2.waitKey(50)
+
+    for fill in list(range(-1,10,3)):
+        blank = np.zeros([300, 400])
+        centers = np.random.randint(-10, 410, (2000, 2))
+        draw_circles(blank, centers, np.random.randint(1, 8, 2000), np.random.rand(2000), fill)
+        cv2.imshow('',blank)
+        cv2.waitKey(200)
@@ -0,0 +1,470 @@
+import pytest
+import os, sys, logging, threading, time, types, datetime, gzip, json
+from types import SimpleNamespace
+
+try:
+    import generalUtils.general_utils
+except ImportError:
+    # general_utils is not part of this tree, stand in for its ensure_file
+    def ensure_file(filename):
+        fullpath = os.path.abspath(filename)
+        os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+        open(fullpath, 'a').close()
+        return SimpleNamespace(fullpath=fullpath, filename=os.path.basename(fullpath))
+
+    sys.modules['generalUtils.general_utils'] = types.ModuleType('generalUtils.general_utils')
+    sys.modules['generalUtils.general_utils'].ensure_file = ensure_file
+
+import numpy as np
+from generalUtils.logger_recorder import Logger, Recorder, BinaryRecorder, RecorderReader, read_recording, \
+    SegmentedFileHandler, find_segments
+
+names = iter(range(1000000))
+
+
+def make_logger(path, **kwargs):
+    """Logger with its own logging.Logger, to a file in path"""
+    i = next(names)
+    kwargs.setdefault('level', logging.DEBUG)
+    return Logger(os.path.join(str(path), 'log{}.log'.format(i)), logger_name='test logger {}'.format(i), **kwargs)
+
+
+def messages(logger):
+    with open(logger.file.fullpath) as f:
+        return [line.split(':: ', 1)[1] for line in f.read().splitlines()]
+
+
+def wait_for_empty(q, timeout=5.0):
+    end = time.time() + timeout
+    while not q.empty():
+        assert time.time() < end
+        time.sleep(0.001)
+
+
+class HeldWriter():
+    """Holds the Logger's file lock, the writer thread blocks on it after taking what is queued"""
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def __enter__(self):
+        self.lock = Logger.locks[self.logger.file.fullpath]
+        self.lock.acquire()
+        self.logger.log('first')
+        wait_for_empty(self.logger._queue)
+        time.sleep(0.01)
+        return self
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+
+def test_async(tmp_path):
+    lg = make_logger(tmp_path, asynchronous=True)
+    assert lg._writer.is_alive()
+
+    def log_many(t):
+        for i in range(500):
+            lg.log('{} {}'.format(t, i))
+
+    threads = [threading.Thread(target=log_many, args=(t,)) for t in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    lg.flush()
+
+    lines = messages(lg)
+    assert lines[0].startswith('Log started')
+    assert len(lines) == 1 + 4 * 500
+    for t in range(4):
+        # each thread's messages in order
+        assert [l for l in lines if l.startswith('{} '.format(t))] == ['{} {}'.format(t, i) for i in range(500)]
+
+    # below the logger's level, not queued
+    lg.logger.setLevel(logging.INFO)
+    lg.log('debug', logging.DEBUG)
+    lg.flush()
+    assert 'debug' not in messages(lg)
+    lg.close()
+
+    with pytest.raises(ValueError):
+        make_logger(tmp_path, asynchronous=True, overflow='drop-everything')
+
+
+def test_flush_close(tmp_path):
+    lg = make_logger(tmp_path, asynchronous=True)
+    with HeldWriter(lg):
+        lg.log('queued')
+        assert 'queued' not in messages(lg)
+    lg.flush()
+    assert messages(lg)[-2:] == ['first', 'queued']
+
+    writer = lg._writer
+    with HeldWriter(lg):
+        lg.log('before close')
+        closing = threading.Thread(target=lg.close)
+        closing.start()
+        closing.join(0.1)
+        assert closing.is_alive()  # waiting for the writer
+    closing.join(5)
+    assert not closing.is_alive() and not writer.is_alive()
+    assert lg._queue is None and lg._writer is None
+    assert messages(lg)[-1] == 'before close'
+
+    # writes on the calling thread after close
+    lg.log('after close')
+    assert messages(lg)[-1] == 'after close'
+    lg.close()
+
+
+def test_overflow(tmp_path):
+    # 'block' waits for room
+    lg = make_logger(tmp_path, asynchronous=True, queue_size=5, overflow='block')
+    with HeldWriter(lg):
+        logging_thread = threading.Thread(target=lambda: [lg.log('m{}'.format(i)) for i in range(10)])
+        logging_thread.start()
+        logging_thread.join(0.1)
+        assert logging_thread.is_alive()
+    logging_thread.join(5)
+    lg.close()
+    assert messages(lg)[1:] == ['first'] + ['m{}'.format(i) for i in range(10)]
+    assert lg.dropped == 0
+
+    # 'drop-new' keeps what is queued
+    lg = make_logger(tmp_path, asynchronous=True, queue_size=5, overflow='drop-new')
+    with HeldWriter(lg):
+        for i in range(10):
+            lg.log('m{}'.format(i))
+    lg.close()
+    assert messages(lg)[1:] == ['first'] + ['m{}'.format(i) for i in range(5)]
+    assert lg.dropped == 5
+
+    # 'drop-oldest' keeps the newest
+    lg = make_logger(tmp_path, asynchronous=True, queue_size=5, overflow='drop-oldest')
+    with HeldWriter(lg):
+        for i in range(10):
+            lg.log('m{}'.format(i))
+    lg.close()
+    assert messages(lg)[1:] == ['first'] + ['m{}'.format(i) for i in range(5, 10)]
+    assert lg.dropped == 5
+
+
+def test_overflow_keeps_close_signal(tmp_path):
+    lg = make_logger(tmp_path, asynchronous=True, queue_size=2, overflow='drop-oldest')
+    with HeldWriter(lg):
+        closing = threading.Thread(target=lg.close)
+        closing.start()
+        end = time.time() + 5
+        while lg._queue.qsize() < 1:
+            assert time.time() < end
+            time.sleep(0.001)
+        lg.log('a')
+        lg.log('b')  # queue is full, the oldest is close()'s stop signal
+    closing.join(5)
+    assert not closing.is_alive()
+    assert messages(lg)[1:] == ['first', 'a']
+    assert lg.dropped == 1
+
+
+def test_binary_recorder(tmp_path):
+    filename = os.path.join(str(tmp_path), 'rec.bin')
+    rec = BinaryRecorder(filename, buffer_rows=7, str_width=4)
+    t0 = time.time()
+    for i in range(20):
+        # keys past the first record's are ignored
+        extra = dict(extra='ignored') if i else dict()
+        rec.log(dict(i=i, x=i / 2, ok=i % 2 == 0, name='n{}'.format(i), v=np.arange(3) * i, **extra))
+    rec.close()
+
+    data = read_recording(filename)
+    assert data.dtype.names == ('_time', 'i', 'x', 'ok', 'name', 'v')
+    assert list(data['i']) == list(range(20))
+    assert list(data['x']) == [i / 2 for i in range(20)]
+    assert list(data['ok']) == [i % 2 == 0 for i in range(20)]
+    assert list(data['name']) == ['n{}'.format(i) for i in range(20)]
+    assert np.array_equal(data['v'], np.arange(3) * np.arange(20)[:, None])
+    assert np.all(np.diff(data['_time']) >= 0) and t0 <= data['_time'][0] <= time.time()
+
+    # appending to an existing file keeps its fields
+    rec = BinaryRecorder(filename, buffer_rows=7)
+    for i in range(20, 25):
+        rec.log(dict(i=i, x=0.5, ok=True, name='longer than str_width', v=np.zeros(3)))
+    rec.flush()
+    assert list(read_recording(filename)['i']) == list(range(25))
+    assert read_recording(filename)['name'][-1] == 'long'  # cut to the first record's width
+    rec.close()
+
+    # memory-mapped, and a partly written last row is left out
+    with open(filename, 'ab') as f:
+        f.write(b'\0' * (data.dtype.itemsize // 2))
+    mapped = read_recording(filename, mmap=True)
+    assert isinstance(mapped, np.memmap)
+    assert len(mapped) == 25
+    assert np.array_equal(mapped[:20], data)
+
+
+def test_binary_recorder_exact_fields(tmp_path):
+    rec = BinaryRecorder(os.path.join(str(tmp_path), 'rec.bin'))
+    rec.log(dict(i=2, ok=True, v=np.arange(2), x=1.5))
+    rec.log(dict(i=3.0, ok=np.bool_(False), v=np.array([1.0, 2.0]), x=7))  # no information lost
+    for bad in (dict(i=2.7), dict(i='3'), dict(i=float('nan')), dict(ok=2), dict(v=np.array([0.5, 1.0]))):
+        with pytest.raises(TypeError):
+            rec.log(dict(dict(i=2, ok=True, v=np.arange(2), x=1.5), **bad))
+    rec.close()
+    data = read_recording(rec.file.fullpath)
+    assert list(data['i']) == [2, 3] and list(data['x']) == [1.5, 7.0]
+
+    # a single field
+    rec = BinaryRecorder(os.path.join(str(tmp_path), 'one.bin'))
+    rec.log(dict(a=1))
+    rec.log(dict(a=2))
+    rec.close()
+    assert list(read_recording(rec.file.fullpath)['a']) == [1, 2]
+
+
+def test_binary_recorder_threads(tmp_path):
+    rec = BinaryRecorder(os.path.join(str(tmp_path), 'rec.bin'), buffer_rows=16)
+    rec.log(dict(thread=-1, i=-1))
+
+    def log_many(t):
+        for i in range(2000):
+            rec.log(dict(thread=t, i=i))
+
+    threads = [threading.Thread(target=log_many, args=(t,)) for t in range(6)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    rec.close()
+
+    data = read_recording(rec.file.fullpath)
+    assert len(data) == 1 + 6 * 2000
+    for t in range(6):
+        assert list(data['i'][data['thread'] == t]) == list(range(2000))
+
+
+def test_recorder_reader_text(tmp_path):
+    rec = Recorder(os.path.join(str(tmp_path), 'rec.txt'))
+    for i in range(300):
+        rec.log(dict(_time=i, i=i, name='n{}'.format(i)))
+    rr = RecorderReader(rec.file.fullpath, index_stride=16)
+    assert len(rr) == 300
+    assert rr[100] == dict(_time=100, i=100, name='n100')
+    assert rr.find_time(250.5) == 251
+    assert [r['i'] for r in rr.records(t0=10, t1=13)] == [10, 11, 12]
+    assert [r['i'] for r in RecorderReader(rec.file.fullpath, convert=False).records(t0=10, t1=13)] == ['10', '11', '12']
+    chunks = list(rr.columns(['i'], chunk_size=128))
+    assert [len(c['i']) for c in chunks] == [128, 128, 44]
+
+    # grown, the saved index is extended
+    for i in range(300, 310):
+        rec.log(dict(_time=i, i=i, name='n{}'.format(i)))
+    assert len(RecorderReader(rec.file.fullpath, index_stride=16)) == 310
+    assert len(rr) == 310
+
+    # emptied then regrown past its old size, the index is remade
+    rec.clear_log(0)
+    for i in range(400):
+        rec.log(dict(_time=5000 + i, i=i, name='n{}'.format(i)))
+    rec.close()
+    for reader in (rr, RecorderReader(rec.file.fullpath, index_stride=16)):
+        assert len(reader) == 400
+        assert reader[64]['i'] == 64
+        assert reader.find_time(5100) == 100
+
+
+def old_lines(filename, n, age=7200):
+    """Write n default format lines 'age' seconds old to filename"""
+    stamp = logging.Formatter().formatTime(logging.makeLogRecord(dict(created=time.time() - age)))
+    with open(filename, 'w') as f:
+        f.writelines('{}::old::INFO:: old {}\n'.format(stamp, i) for i in range(n))
+
+
+def test_clear_log(tmp_path, monkeypatch):
+    filename = os.path.join(str(tmp_path), 'default.log')
+    old_lines(filename, 50)
+    lg = Logger(filename, logger_name='test clear default', level=logging.DEBUG)
+    lg.log('new\nsecond line')
+    lg.clear_log(3600)
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 3 and 'Log started' in lines[0]
+    assert lines[1].endswith(':: new') and lines[2] == 'second line'
+    lg.log('after')
+    lg.clear_log(3600)
+    with open(filename) as f:
+        assert f.read().splitlines()[:3] == lines
+    lg.close()
+
+    # without default format timestamps nothing is known to be old, found without searching the file
+    lg = make_logger(tmp_path, format_string='%(levelname)s %(message)s')
+    for i in range(20):
+        lg.log('m{}'.format(i))
+    searched = []
+    monkeypatch.setattr(Logger, '_timestamped_line', staticmethod(lambda *args: searched.append(args)))
+    lg.clear_log(3600)
+    assert searched == []
+    with open(lg.file.fullpath) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 21 and lines[-1] == 'DEBUG m19'
+    lg.close()
+
+    rec = Recorder(os.path.join(str(tmp_path), 'rec.txt'))
+    for i in range(20):
+        rec.log(dict(i=i))
+    rec.clear_log(3600)
+    rec.close()
+    assert searched == []
+    assert [r['i'] for r in RecorderReader(rec.file.fullpath, index=False).records()] == list(range(20))
+
+
+class CountingFormatter(logging.Formatter):
+    calls = 0
+
+    def format(self, record):
+        CountingFormatter.calls += 1
+        return super().format(record)
+
+
+def handle(handler, created, message):
+    handler.handle(logging.makeLogRecord(dict(msg=message, created=created, levelno=logging.INFO)))
+
+
+def read_segment(path):
+    with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as f:
+        return f.read()
+
+
+def test_segments_size(tmp_path):
+    filename = os.path.join(str(tmp_path), 'seg.log')
+    fh = SegmentedFileHandler(filename, max_bytes=100)
+    fh.setFormatter(CountingFormatter('%(message)s'))
+    CountingFormatter.calls = 0
+    t0 = time.time()
+    for i in range(40):
+        handle(fh, t0 + i, 'message {:03d}'.format(i))  # 12 bytes a line
+    assert CountingFormatter.calls == 40  # once each
+    fh.close()
+
+    paths = find_segments(filename)
+    assert len(paths) == 5 and paths[-1] == os.path.abspath(filename)
+    assert all(os.path.getsize(p) <= 100 for p in paths)
+    text = ''.join(read_segment(p) for p in paths)
+    assert text == ''.join('message {:03d}\n'.format(i) for i in range(40))
+
+    with open(filename + '.manifest.json') as f:
+        manifest = json.load(f)
+    starts = [e['start'] for e in manifest['segments']] + [manifest['current']['start']]
+    assert starts == [t0 + i for i in range(0, 40, 8)]
+    assert [e['end'] for e in manifest['segments']] == [t0 + i for i in range(7, 32, 8)]
+    assert [e['bytes'] for e in manifest['segments']] == [96] * 4
+    assert find_segments(filename, t0 + 10, t0 + 20) == paths[1:3]
+    assert find_segments(filename, t0 + 35) == paths[-1:]
+
+    # picks up where it left off, the current file is full
+    fh = SegmentedFileHandler(filename, max_bytes=100)
+    fh.setFormatter(logging.Formatter('%(message)s'))
+    handle(fh, t0 + 40, 'message 040')
+    segments = fh.segments()
+    assert len(segments) == 6 and segments[:4] == paths[:4] and segments[-1] == paths[-1]
+    assert read_segment(segments[4]) == ''.join('message {:03d}\n'.format(i) for i in range(32, 40))
+    assert fh.segments(t0 + 40) == paths[-1:] and read_segment(paths[-1]) == 'message 040\n'
+    fh.close()
+
+
+def test_segments_size_encoded(tmp_path):
+    # max_bytes counts encoded bytes, 'é' is 2 in utf-8
+    filename = os.path.join(str(tmp_path), 'seg.log')
+    fh = SegmentedFileHandler(filename, max_bytes=100, encoding='utf-8')
+    fh.setFormatter(logging.Formatter('%(message)s'))
+    lines = ['a' * 48 if i % 2 else '\u00e9' * 48 for i in range(10)]
+    t0 = time.time()
+    for i, line in enumerate(lines):
+        handle(fh, t0 + i, line)
+    fh.close()
+    paths = find_segments(filename)
+    assert len(paths) == 10 and all(0 < os.path.getsize(p) <= 100 for p in paths)
+    text = ''
+    for p in paths:
+        with open(p, encoding='utf-8') as f:
+            text += f.read()
+    assert text == ''.join(line + '\n' for line in lines)
+
+
+def test_segments_interval_daily(tmp_path):
+    filename = os.path.join(str(tmp_path), 'seg.log')
+    fh = SegmentedFileHandler(filename, interval=10)
+    fh.setFormatter(logging.Formatter('%(message)s'))
+    t0 = time.time()
+    for i in range(25):
+        handle(fh, t0 + i, str(i))
+    fh.close()
+    paths = find_segments(filename)
+    assert [read_segment(p).split() for p in paths] == [[str(i) for i in range(j, min(j + 10, 25))]
+                                                        for j in (0, 10, 20)]
+
+    filename = os.path.join(str(tmp_path), 'daily', 'seg.log')
+    os.makedirs(os.path.dirname(filename))
+    fh = SegmentedFileHandler(filename, daily=True)
+    fh.setFormatter(logging.Formatter('%(message)s'))
+    t0 = datetime.datetime(2026, 3, 1, 23, 59, 50).timestamp()
+    for i in range(0, 48 * 3600, 600):
+        handle(fh, t0 + i, str(i))
+    fh.close()
+    paths = find_segments(filename)
+    # the last day is the current segment until a record from the next day comes
+    assert [os.path.basename(os.path.dirname(p)) for p in paths] == ['2026-03-01', '2026-03-02', 'daily']
+    assert os.path.basename(paths[0]) == 'seg.20260301-235950.log'
+    assert [len(read_segment(p).split()) for p in paths] == [1, 144, 143]
+
+
+def test_segments_compress_remove(tmp_path):
+    filename = os.path.join(str(tmp_path), 'seg.log')
+    fh = SegmentedFileHandler(filename, max_bytes=50, compress=True)
+    fh.setFormatter(logging.Formatter('%(message)s'))
+    t0 = time.time()
+    for i in range(30):
+        handle(fh, t0 + i, 'message {:03d}'.format(i))
+    fh.close()  # waits for compression
+
+    paths = find_segments(filename)
+    assert len(paths) == 8
+    assert all(p.endswith('.gz') for p in paths[:-1]) and not any(p.endswith('.log') for p in paths[:-1])
+    assert [f for f in os.listdir(str(tmp_path)) if f.endswith('.tmp')] == []
+    assert ''.join(read_segment(p) for p in paths) == ''.join('message {:03d}\n'.format(i) for i in range(30))
+    with open(filename + '.manifest.json') as f:
+        assert all(e['compressed'] for e in json.load(f)['segments'])
+
+    fh = SegmentedFileHandler(filename, max_bytes=50)
+    fh.remove_before(t0 + 10)  # segments of 4 lines, the first two end before
+    assert fh.segments() == paths[2:]
+    assert not any(os.path.exists(p) for p in paths[:2])
+    assert find_segments(filename) == paths[2:]
+    fh.clear()
+    assert fh.segments() == paths[-1:] and os.path.getsize(filename) == 0
+    assert not any(os.path.exists(p) for p in paths[:-1])
+    fh.close()
+
+
+def test_segmented_logger(tmp_path):
+    lg = make_logger(tmp_path, segment_bytes=300, asynchronous=True)
+    now = time.time()
+    for i in range(20):
+        lg._enqueue((now - 7200 + i, logging.INFO, 'old {}'.format(i)))
+    for i in range(20):
+        lg.log('new {}'.format(i))
+    lg.flush()
+    paths = lg.segments()
+    assert len(paths) > 4
+    assert lg.segments(now - 3600)[0] != paths[0]
+
+    lg.clear_log(3600)
+    kept = lg.segments()
+    assert kept == lg.segments(now - 3600) and all(os.path.exists(p) for p in kept)
+    assert not any(os.path.exists(p) for p in paths if p not in kept)
+    text = ''.join(read_segment(p) for p in kept)
+    # whole segments, the one with the last old and first new messages is kept
+    assert 'old 0' not in text and 'new 0' in text and 'new 19' in text
+
+    lg.clear_log(0)
+    assert lg.segments() == [lg.file.fullpath] and os.path.getsize(lg.file.fullpath) == 0
+    lg.log('after clear')
+    lg.close()
+    assert messages(lg) == ['after clear']
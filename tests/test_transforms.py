@@ -0,0 +1,91 @@
+import pytest
+import numpy as np
+from generalUtils import constrain, constrain_2, constrain_decider, rescale, deadband, deadband_2, \
+    Rescaler, Deadband, Constrainer, Pipeline
+
+
+def test_array_matches_scalar():
+    vals = np.linspace(-3, 3, 61)
+
+    assert np.array_equal(constrain_2(vals, -1, 2), [constrain_2(v, -1, 2) for v in vals])
+    assert np.array_equal(constrain(vals, 1.5), [constrain(v, 1.5) for v in vals])
+    assert np.array_equal(constrain_decider(vals, -1, 1, vals * 10),
+                          [constrain_decider(v, -1, 1, v * 10) for v in vals])
+    assert np.array_equal(deadband_2(vals, -1, 0.5, 7), [deadband_2(v, -1, 0.5, 7) for v in vals])
+    assert np.array_equal(deadband(vals, 1.2), [deadband(v, 1.2) for v in vals])
+
+    for outside in ['mid', 'constrain', 'ignore', -100]:
+        assert np.array_equal(rescale(vals, -2, 2, 0, 10, outside),
+                              [rescale(v, -2, 2, 0, 10, outside) for v in vals])
+    assert np.isnan(rescale(vals, -2, 2, 0, 10, None)[0])
+
+    # 'raise' is element-wise too
+    assert np.array_equal(rescale(vals[10:-10], -2, 2, 0, 10), [rescale(v, -2, 2, 0, 10) for v in vals[10:-10]])
+    with pytest.raises(Exception):
+        rescale(vals, -2, 2, 0, 10, 'raise')
+
+
+def test_array_out():
+    vals = np.linspace(-3, 3, 61)
+    expected = rescale(vals, -3, 3, 0, 1)
+
+    # in-place
+    buf = vals.copy()
+    assert rescale(buf, -3, 3, 0, 1, out=buf) is buf
+    assert np.array_equal(buf, expected)
+    assert constrain(buf, 0.5, out=buf) is buf
+    assert buf.max() == 0.5
+    assert deadband_2(buf, 0, 0.25, out=buf) is buf
+    assert np.all((buf == 0) | (buf >= 0.25))
+
+    # separate buffer, int input
+    ints = np.arange(11)
+    out = np.empty(11)
+    assert rescale(ints, 0, 10, 0, 1, out=out) is out
+    assert np.array_equal(out, [rescale(i, 0, 10, 0, 1) for i in range(11)])
+
+
+def test_transforms():
+    vals = np.linspace(-3, 3, 61)
+
+    for outside in ['mid', 'constrain', 'ignore', -100, None]:
+        r = Rescaler(-2, 2, 0, 10, outside)
+        assert [r(v) for v in vals] == [rescale(v, -2, 2, 0, 10, outside) for v in vals]
+        assert np.array_equal(r(vals), rescale(vals, -2, 2, 0, 10, outside), equal_nan=True)
+    with pytest.raises(Exception):
+        Rescaler(-2, 2, 0, 10)(3)
+
+    d = Deadband(-1, 0.5, 7)
+    assert [d(v) for v in vals] == [deadband_2(v, -1, 0.5, 7) for v in vals]
+    assert np.array_equal(d(vals), deadband_2(vals, -1, 0.5, 7))
+
+    c = Constrainer(-1, 2)
+    assert [c(v) for v in vals] == [constrain_2(v, -1, 2) for v in vals]
+    assert np.array_equal(c(vals), constrain_2(vals, -1, 2))
+
+
+def test_pipeline():
+    vals = np.linspace(0, 1023, 1024)
+    pipe = Rescaler(0, 1023, -1, 1) | Deadband(-.05, .05) | Constrainer(-.8, .8)
+    assert isinstance(pipe, Pipeline)
+    assert len(pipe.transforms) == 3
+
+    expected = [constrain_2(deadband_2(rescale(v, 0, 1023, -1, 1), -.05, .05), -.8, .8) for v in vals]
+    assert [pipe(v) for v in vals] == expected
+    assert [pipe.scalar(v) for v in vals] == expected
+    assert np.array_equal(pipe(vals), expected)
+
+    # single buffer
+    out = np.empty_like(vals)
+    assert pipe(vals, out=out) is out
+    assert np.array_equal(out, expected)
+
+    # nested pipelines are flattened
+    assert len((pipe | pipe).transforms) == 6
+
+    # integer input, first step keeps the dtype but later steps produce floats
+    ints = np.arange(10)
+    pipe = Constrainer(0, 5) | Rescaler(0, 10, 0, 1)
+    expected = rescale(constrain_2(ints, 0, 5), 0, 10, 0, 1)
+    assert np.array_equal(pipe(ints), expected)
+    assert [pipe(int(i)) for i in ints] == list(expected)